@@ -0,0 +1,350 @@
+import os
+import csv
+import time
+import argparse
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from csv_store import read_csv_rows
+from tracing import Tracer
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+# Expected conversions: ActionTrackerId,CampaignId,Oid,EventDate,Amount,Currency
+# (MediaPartnerId is optional, as in clo_validate_YYYYMMDD_HHMMSS.csv)
+TEMPLATE_CSV = "clo_validation_template.csv"
+
+# Report name gets the run timestamp appended
+REPORT_PREFIX = "clo_match_report"
+
+# One IN-list query per (tracker, date window); same size as our sqsp_inlist_500 batches
+MAX_IN_LIST = 500
+
+# A group never spans more than this many days of EventDate
+GROUP_MAX_DAYS = 7
+
+# EventDate in the template is when we sent it, not always when it landed
+DATE_PAD_DAYS = 1
+
+MAX_RECORDS = 20000
+
+DATA_SOURCE = "r_ds_singlestore"
+
+OPERATOR_QUERY_URL = "https://operator.impactradius.net/secure/operator/report/queryrunner/res/index.html"
+
+DOWNLOAD_DIR = os.path.abspath("downloaded_csv")
+
+CHROME_PROFILE_DIR = os.path.abspath("my_chrome_profile")
+
+LOOKUP_SQL_TEMPLATE = """
+SELECT
+    action_tracker_id,
+    campaign_id,
+    oid,
+    event_datetime
+FROM conversion_fact
+WHERE network_id = 1
+  AND action_tracker_id = {ACTION_TRACKER_ID}
+  AND event_datetime >= '{START}'
+  AND event_datetime < '{END}'
+  AND oid IN ({OID_LIST})
+"""
+
+DATE_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d")
+
+###############################################################################
+# HELPER FUNCTIONS
+###############################################################################
+
+def parse_event_date(val):
+    """
+    Parse the template's EventDate (e.g. '2025-07-09 00:09:33'). None if blank/bad.
+    """
+    val = (val or "").strip().replace("Z", "")
+    if "." in val:
+        val = val.split(".")[0]
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(val, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+def sql_quote(val):
+    return "'" + str(val).replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+def load_expected(template_path):
+    """
+    Read the template into a list of dicts (one per expected conversion).
+    """
+    expected = []
+    with open(template_path, "r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            atid = (row.get("ActionTrackerId") or "").strip()
+            oid = (row.get("Oid") or "").strip()
+            if not atid or not oid:
+                continue
+            expected.append({
+                "ActionTrackerId": atid,
+                "CampaignId": (row.get("CampaignId") or "").strip(),
+                "MediaPartnerId": (row.get("MediaPartnerId") or "").strip(),
+                "Oid": oid,
+                "EventDate": (row.get("EventDate") or "").strip(),
+                "Amount": (row.get("Amount") or "").strip(),
+                "Currency": (row.get("Currency") or "").strip(),
+                "_event_dt": parse_event_date(row.get("EventDate")),
+            })
+    return expected
+
+
+def group_expected(expected):
+    """
+    Group expected rows by tracker, then split each tracker's rows (sorted by
+    EventDate) into windows of at most GROUP_MAX_DAYS and MAX_IN_LIST OIDs.
+    Returns a list of (tracker_id, start, end, [oid, ...]).
+    Rows without a usable EventDate get their own open-ended group per tracker.
+    """
+    by_tracker = defaultdict(list)
+    undated = defaultdict(list)
+    for row in expected:
+        if row["_event_dt"] is None:
+            undated[row["ActionTrackerId"]].append(row["Oid"])
+        else:
+            by_tracker[row["ActionTrackerId"]].append((row["_event_dt"], row["Oid"]))
+
+    pad = timedelta(days=DATE_PAD_DAYS)
+    max_span = timedelta(days=GROUP_MAX_DAYS)
+    groups = []
+
+    for atid, dated in by_tracker.items():
+        dated.sort()
+        window = []
+        window_start = None
+        for event_dt, oid in dated:
+            if window and (event_dt - window_start > max_span or len(window) >= MAX_IN_LIST):
+                groups.append((atid, window_start - pad, window[-1][0] + pad, [o for _, o in window]))
+                window = []
+            if not window:
+                window_start = event_dt
+            window.append((event_dt, oid))
+        if window:
+            groups.append((atid, window_start - pad, window[-1][0] + pad, [o for _, o in window]))
+
+    for atid, oids in undated.items():
+        for i in range(0, len(oids), MAX_IN_LIST):
+            groups.append((atid, None, None, oids[i:i + MAX_IN_LIST]))
+
+    return groups
+
+
+def build_lookup_sql(atid, start, end, oids):
+    start = start or datetime(2000, 1, 1)
+    end = end or datetime.now() + timedelta(days=1)
+    # de-dupe but keep it deterministic for the query log
+    oid_list = ",".join(sql_quote(o) for o in sorted(set(oids)))
+    return LOOKUP_SQL_TEMPLATE.format(
+        ACTION_TRACKER_ID=int(atid),
+        START=start.strftime("%Y-%m-%d %H:%M:%S"),
+        END=end.strftime("%Y-%m-%d %H:%M:%S"),
+        OID_LIST=oid_list,
+    ).strip()
+
+###############################################################################
+# BACKENDS
+###############################################################################
+
+class FixtureBackend:
+    """
+    Answers lookups from a local CSV export of conversion_fact
+    (columns action_tracker_id, campaign_id, oid, event_datetime).
+    Same filtering as LOOKUP_SQL_TEMPLATE, no browser needed.
+    """
+    def __init__(self, fixture_csv):
+        self.rows_by_tracker = defaultdict(list)
+        with open(fixture_csv, "r", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                self.rows_by_tracker[str(row.get("action_tracker_id", "")).strip()].append(row)
+        self.queries = 0
+
+    def fetch(self, atid, start, end, oids):
+        self.queries += 1
+        wanted = set(oids)
+        found = []
+        for row in self.rows_by_tracker.get(str(atid), []):
+            if row.get("oid", "").strip() not in wanted:
+                continue
+            event_dt = parse_event_date(row.get("event_datetime"))
+            if start and event_dt and event_dt < start:
+                continue
+            if end and event_dt and event_dt >= end:
+                continue
+            found.append(row)
+        return found
+
+    def close(self):
+        pass
+
+
+class QueryRunnerBackend:
+    """
+    Runs each lookup through the Operator Query Runner (one query per group).
+    """
+    def __init__(self, tracer=None):
+        # imported here so the fixture backend works without selenium installed
+        from query_session import QueryRunnerSession, make_driver
+
+        self.driver = make_driver(DOWNLOAD_DIR, CHROME_PROFILE_DIR)
+        self.session = QueryRunnerSession(self.driver, DATA_SOURCE, MAX_RECORDS, tracer=tracer)
+        self.queries = 0
+
+        print("\nNavigating to Operator Query Runner page...")
+        self.driver.get(OPERATOR_QUERY_URL)
+        input("\nIf needed, log in with Google. Press Enter once loaded...")
+
+    def fetch(self, atid, start, end, oids):
+        self.queries += 1
+        sql_query = build_lookup_sql(atid, start, end, oids)
+        csv_path = self.session.run_query(
+            sql_query, DOWNLOAD_DIR, f"clo_lookup_{atid}_{self.queries}.csv", tracker=atid
+        )
+        if not csv_path:
+            raise RuntimeError(f"Lookup query failed for tracker {atid}")
+        return read_csv_rows(csv_path)
+
+    def close(self):
+        print("Closing browser.")
+        self.driver.quit()
+
+###############################################################################
+# VALIDATION
+###############################################################################
+
+def validate(expected, backend, tracer=None):
+    """
+    Look up every group through 'backend', build a hash index on
+    (action_tracker_id, oid) and join the expected rows against it.
+    Returns one report row (dict) per expected conversion.
+    """
+    groups = group_expected(expected)
+    print(f"{len(expected)} expected conversions in {len(groups)} lookup groups.")
+
+    # (action_tracker_id, oid) -> [found rows]
+    index = defaultdict(list)
+    # (action_tracker_id, oid) of every group whose lookup failed; other
+    # groups of the same tracker still count as looked up
+    failed_keys = set()
+    for i, (atid, start, end, oids) in enumerate(groups, 1):
+        print(f"  [{i}/{len(groups)}] tracker {atid}: {len(oids)} OIDs")
+        try:
+            if tracer is not None:
+                with tracer.span("lookup", tracker=atid) as sp:
+                    found = backend.fetch(atid, start, end, oids)
+                    sp.add(rows=len(found), oids=len(oids))
+            else:
+                found = backend.fetch(atid, start, end, oids)
+        except Exception as e:
+            print(f"  Lookup failed for tracker {atid}: {e}")
+            failed_keys.update((atid, oid) for oid in oids)
+            continue
+        for row in found:
+            key = (str(row.get("action_tracker_id", "")).strip(), str(row.get("oid", "")).strip())
+            index[key].append(row)
+
+    report = []
+    for row in expected:
+        hits = index.get((row["ActionTrackerId"], row["Oid"]), [])
+        if hits:
+            campaigns = sorted({str(h.get("campaign_id", "")).strip() for h in hits})
+            if row["CampaignId"] and row["CampaignId"] not in campaigns:
+                status = "campaign_mismatch"
+            elif len(hits) > 1:
+                status = "duplicate"
+            else:
+                status = "matched"
+        elif (row["ActionTrackerId"], row["Oid"]) in failed_keys:
+            status = "lookup_failed"
+            campaigns = []
+        else:
+            status = "missing"
+            campaigns = []
+
+        report.append({
+            "ActionTrackerId": row["ActionTrackerId"],
+            "CampaignId": row["CampaignId"],
+            "MediaPartnerId": row["MediaPartnerId"],
+            "Oid": row["Oid"],
+            "EventDate": row["EventDate"],
+            "Amount": row["Amount"],
+            "Currency": row["Currency"],
+            "status": status,
+            "found_count": len(hits),
+            "found_campaign_ids": ",".join(campaigns),
+            "found_event_datetimes": ",".join(
+                sorted(str(h.get("event_datetime", "")).strip() for h in hits)
+            ),
+        })
+    return report
+
+
+def write_report(report, out_dir="."):
+    path = os.path.join(out_dir, f"{REPORT_PREFIX}_{time.strftime('%Y%m%d_%H%M%S')}.csv")
+    fieldnames = [
+        "ActionTrackerId", "CampaignId", "MediaPartnerId", "Oid", "EventDate",
+        "Amount", "Currency", "status", "found_count", "found_campaign_ids",
+        "found_event_datetimes",
+    ]
+    with open(path, "w", newline="", encoding="utf-8") as out_f:
+        writer = csv.DictWriter(out_f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(report)
+    return path
+
+###############################################################################
+# MAIN SCRIPT
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk CLO conversion validation.")
+    parser.add_argument("template", nargs="?", default=TEMPLATE_CSV,
+                        help=f"expected conversions CSV (default {TEMPLATE_CSV})")
+    parser.add_argument("--fixture", metavar="CSV",
+                        help="answer lookups from a local conversion_fact CSV instead of Query Runner")
+    parser.add_argument("--out-dir", default=".", help="where to write the match report")
+    args = parser.parse_args()
+
+    tracer = Tracer("clo_validate")
+
+    expected = load_expected(args.template)
+    if not expected:
+        print(f"No expected conversions found in {args.template}.")
+        return
+
+    if args.fixture:
+        backend = FixtureBackend(args.fixture)
+    else:
+        backend = QueryRunnerBackend(tracer=tracer)
+
+    try:
+        report = validate(expected, backend, tracer=tracer)
+    finally:
+        backend.close()
+
+    path = write_report(report, args.out_dir)
+    counts = defaultdict(int)
+    for r in report:
+        counts[r["status"]] += 1
+    print(f"\nWrote {len(report)} rows to {path} ({backend.queries} lookup queries).")
+    for status in sorted(counts):
+        print(f"  {status}: {counts[status]}")
+
+    tracer.summary()
+    tracer.close()
+
+
+if __name__ == "__main__":
+    main()
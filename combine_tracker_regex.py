@@ -2,11 +2,27 @@ import csv
 import re
 import json
 import os
+import hashlib
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from tracing import Tracer
 
 INPUT_CSV = "final_url_variations.csv"
 OUTPUT_CSV = "tracker_regex.csv"
 
+# Input hash + output regex per tracker from the last run; trackers whose
+# inputs haven't changed (and whose row in OUTPUT_CSV is still the same)
+# are copied over without being rebuilt or re-validated.
+CACHE_JSON = "tracker_regex_cache.json"
+
+# re.compile() of the big alternations dominates the runtime, so validation
+# goes to a process pool once there are at least this many patterns to check.
+PARALLEL_MIN_PATTERNS = 8
+MAX_WORKERS = None  # None -> os.cpu_count()
+
+tracer = Tracer("combine_tracker_regex")
+
 
 def escape_slashes_for_regex101(pattern: str) -> str:
     """
@@ -37,6 +53,135 @@ def validate_python_regex(pat: str) -> bool:
         return False
 
 
+def content_hash(*parts) -> str:
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def unify_domain_patterns(domain_info):
+    """
+    domain_info is a list of (domain, pattern_list) for one tracker.
+    Returns domain -> set_of_patterns (domains in first-seen order).
+    """
+    domain_patterns_map = defaultdict(set)
+    for (dom, p_list) in domain_info:
+        domain_patterns_map[dom].update(p_list)
+    return domain_patterns_map
+
+
+def block_key(dom, pat_set) -> str:
+    return content_hash(dom, *sorted(pat_set))
+
+
+def build_domain_block(dom, pat_set):
+    """
+    (?:[\w.-]+\.)?dom_escaped(?:p1|p2|...) for one domain.
+    """
+    # remove leading "www."
+    dom_core = dom
+    if dom_core.startswith("www."):
+        dom_core = dom_core[4:]
+    dom_escaped = re.escape(dom_core)
+
+    # join the patterns in an OR
+    # e.g. (?:/billing(?:/.*)?|/paypal(?:/.*)?)
+    sorted_pats = sorted(pat_set)
+    joined_pats = "|".join(sorted_pats)
+    if len(sorted_pats) > 1:
+        pattern_block = f"(?:{joined_pats})"
+    else:
+        pattern_block = joined_pats  # if only one pat, no need for (?: )
+
+    return rf"(?:[\w.-]+\.)?{dom_escaped}(?:{pattern_block})"
+
+
+class DomainBlockCache:
+    """
+    Domain blocks keyed by a content hash of (domain, pattern set), so a domain
+    shared by many trackers is only built once per run.
+    """
+    def __init__(self):
+        self.blocks = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, dom, pat_set):
+        block = self.blocks.get(key)
+        if block is None:
+            self.misses += 1
+            block = build_domain_block(dom, pat_set)
+            self.blocks[key] = block
+        else:
+            self.hits += 1
+        return block
+
+
+def build_tracker_pattern(domain_patterns_map, keys, block_cache):
+    """
+    Returns the raw (unescaped) OR-based pattern for one tracker.
+    keys[i] is the block_key() of the i-th domain in domain_patterns_map.
+    """
+    # build an OR pattern
+    # e.g. ^https?:\/\/(?:
+    #   (?:[\w.-]+\.)?domain1(?:p1|p2) |
+    #   (?:[\w.-]+\.)?domain2(...)
+    # )(?:\?.*)?$
+
+    domain_blocks = []
+    for key, (dom, pat_set) in zip(keys, domain_patterns_map.items()):
+        domain_blocks.append(block_cache.get(key, dom, pat_set))
+
+    if domain_blocks:
+        or_clause = "|".join(domain_blocks)
+        raw_pattern = rf"^https?:\/\/(?:{or_clause})(?:\?.*)?$"
+    else:
+        raw_pattern = r"^$"  # fallback if no domain/pattern?
+
+    return raw_pattern
+
+
+def validate_all(patterns):
+    """
+    validate_python_regex() over a list of patterns, in a process pool when
+    there are enough of them to be worth it.
+    """
+    if len(patterns) < PARALLEL_MIN_PATTERNS or (os.cpu_count() or 1) < 2:
+        return [validate_python_regex(p) for p in patterns]
+    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        return list(pool.map(validate_python_regex, patterns, chunksize=4))
+
+
+def load_previous_run():
+    """
+    Returns (cache, previous_output): the CACHE_JSON tracker entries and the
+    {tracker_id: regex} rows currently in OUTPUT_CSV. Both empty if missing.
+    """
+    cache = {}
+    if os.path.exists(CACHE_JSON):
+        try:
+            with open(CACHE_JSON, "r", encoding="utf-8") as f:
+                cache = json.load(f).get("trackers", {})
+        except (ValueError, OSError) as e:
+            print(f"Ignoring unreadable cache {CACHE_JSON}: {e}")
+
+    previous_output = {}
+    if os.path.exists(OUTPUT_CSV):
+        with open(OUTPUT_CSV, "r", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                previous_output[row["action_tracker_dim_id"]] = row["regex_for_regex101"]
+    return cache, previous_output
+
+
+def save_cache(entries):
+    tmp_path = CACHE_JSON + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"trackers": entries}, f)
+    os.replace(tmp_path, CACHE_JSON)
+
+
 def main():
     """
     1) Reads final_url_variations.csv with columns:
@@ -45,8 +190,10 @@ def main():
     3) Builds a single OR-based pattern:
        ^https?:\/\/(?:(?:[\w.-]+\.)?dom_escaped(?:p1|p2) | ...) (?:\?.*)?$
     4) Escapes slashes for /.../ usage on Regex101, then wraps it in leading+trailing '/'.
-    5) Validates in Python's re.compile(...) to catch syntax errors.
+    5) Validates in Python's re.compile(...) to catch syntax errors (in a process pool).
     6) Writes tracker_regex.csv with columns: [action_tracker_dim_id, regex_for_regex101].
+    Trackers whose inputs are unchanged since the last run (see CACHE_JSON) are
+    copied from the previous tracker_regex.csv without being rebuilt.
     """
     if not os.path.exists(INPUT_CSV):
         print(f"ERROR: Could not find input CSV '{INPUT_CSV}'.")
@@ -56,9 +203,11 @@ def main():
     aggregator_map = defaultdict(list)
 
     # Read in final_url_variations.csv
-    with open(INPUT_CSV, "r", encoding="utf-8") as f:
+    with tracer.span("read_input") as sp, open(INPUT_CSV, "r", encoding="utf-8") as f:
+        sp.add(bytes=os.path.getsize(INPUT_CSV))
         reader = csv.DictReader(f)
         for row in reader:
+            sp.add(rows=1)
             domain_str = row["domain"].strip()
             at_ids_str = row["action_tracker_ids"].strip()  # e.g. "153246,33996"
             patterns_json = row["patterns"].strip()
@@ -74,49 +223,48 @@ def main():
                     aggregator_map[tid].append((domain_str, pattern_list))
 
     results = []
+    cache, previous_output = load_previous_run()
+    new_cache = {}
+    block_cache = DomainBlockCache()
+
+    # (tid, raw_pattern, input_hash) still to validate
+    to_validate = []
+    reused = 0
 
+    # Assembled here, in one process, so each domain block is built once per
+    # run however many trackers share it; only re.compile() goes to the pool.
     for tid, domain_info in aggregator_map.items():
-        # domain_info is a list of (domain, pattern_list)
-        # unify domain->set_of_patterns
-        domain_patterns_map = defaultdict(set)
-        for (dom, p_list) in domain_info:
-            domain_patterns_map[dom].update(p_list)
-
-        # build an OR pattern
-        # e.g. ^https?:\/\/(?:
-        #   (?:[\w.-]+\.)?domain1(?:p1|p2) |
-        #   (?:[\w.-]+\.)?domain2(...)
-        # )(?:\?.*)?$
-
-        domain_blocks = []
-        for dom, pat_set in domain_patterns_map.items():
-            # remove leading "www."
-            dom_core = dom
-            if dom_core.startswith("www."):
-                dom_core = dom_core[4:]
-            dom_escaped = re.escape(dom_core)
-
-            # join the patterns in an OR
-            # e.g. (?:/billing(?:/.*)?|/paypal(?:/.*)?)
-            sorted_pats = sorted(pat_set)
-            joined_pats = "|".join(sorted_pats)
-            if len(sorted_pats) > 1:
-                pattern_block = f"(?:{joined_pats})"
-            else:
-                pattern_block = joined_pats  # if only one pat, no need for (?: )
-
-            sub_block = rf"(?:[\w.-]+\.)?{dom_escaped}(?:{pattern_block})"
-            domain_blocks.append(sub_block)
-
-        if domain_blocks:
-            or_clause = "|".join(domain_blocks)
-            raw_pattern = rf"^https?:\/\/(?:{or_clause})(?:\?.*)?$"
-        else:
-            raw_pattern = r"^$"  # fallback if no domain/pattern?
+        with tracer.span("assemble", tracker=tid) as sp:
+            domain_patterns_map = unify_domain_patterns(domain_info)
+            keys = [block_key(dom, pat_set) for dom, pat_set in domain_patterns_map.items()]
+            input_hash = content_hash(*keys)
+
+            cached = cache.get(tid)
+            if (cached and cached.get("input_hash") == input_hash
+                    and previous_output.get(tid) == cached.get("regex")):
+                # unchanged since the last tracker_regex.csv
+                if not cached.get("valid", True):
+                    print(f"WARNING: Pattern for tracker {tid} is invalid in Python: {cached['regex']}")
+                results.append((tid, cached["regex"]))
+                new_cache[tid] = cached
+                reused += 1
+                sp.add(cache_hits=1)
+                continue
+
+            hits_before = block_cache.hits
+            raw_pattern = build_tracker_pattern(domain_patterns_map, keys, block_cache)
+            sp.add(rows=sum(len(p) for p in domain_patterns_map.values()),
+                   block_cache_hits=block_cache.hits - hits_before)
+            to_validate.append((tid, raw_pattern, input_hash))
 
-        # let's do a Python re.compile failsafe check:
-        # We'll check 'raw_pattern' which is unescaped from the Python perspective.
-        if not validate_python_regex(raw_pattern):
+    # let's do a Python re.compile failsafe check:
+    # We'll check 'raw_pattern' which is unescaped from the Python perspective.
+    with tracer.span("validate") as sp:
+        validity = validate_all([raw for _, raw, _ in to_validate])
+        sp.add(rows=len(to_validate))
+
+    for (tid, raw_pattern, input_hash), is_valid in zip(to_validate, validity):
+        if not is_valid:
             print(f"WARNING: Pattern for tracker {tid} is invalid in Python: {raw_pattern}")
             # we can skip or forcibly fix?
             # We'll just forcibly produce it anyway, but note the warning.
@@ -127,15 +275,23 @@ def main():
         final_for_regex101 = f"/{final_escaped}/"
 
         results.append((tid, final_for_regex101))
+        new_cache[tid] = {"input_hash": input_hash, "regex": final_for_regex101, "valid": is_valid}
+
+    print(f"{reused} trackers unchanged, {len(to_validate)} rebuilt "
+          f"({block_cache.hits} domain blocks reused, {block_cache.misses} built).")
 
     # write to tracker_regex.csv
-    with open(OUTPUT_CSV, "w", newline="", encoding="utf-8") as out_f:
+    with tracer.span("write_output"), open(OUTPUT_CSV, "w", newline="", encoding="utf-8") as out_f:
         writer = csv.writer(out_f)
         writer.writerow(["action_tracker_dim_id", "regex_for_regex101"])
         for tid, pat in sorted(results, key=lambda x: x[0]):
             writer.writerow([tid, pat])
 
+    save_cache(new_cache)
+
     print(f"Done! Wrote {len(results)} rows to {OUTPUT_CSV}.")
+    tracer.summary()
+    tracer.close()
 
 
 if __name__ == "__main__":
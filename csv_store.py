@@ -0,0 +1,260 @@
+import io
+import os
+import csv
+import gzip
+import time
+import argparse
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+# "auto" = zstd if the zstandard package is installed, else gzip.
+# "zstd", "gzip" or "none" to force one.
+COMPRESSION = os.environ.get("CSV_COMPRESSION", "auto")
+
+# zstd 3 / gzip 6: close to the best ratio on these exports at a fraction
+# of the CPU cost of the top levels
+ZSTD_LEVEL = 3
+GZIP_LEVEL = 6
+
+# Retention for downloaded_csv: files older than this are removed, then the
+# oldest are removed until the directory fits in RETENTION_MAX_BYTES.
+RETENTION_MAX_BYTES = 2 * 1024 ** 3
+RETENTION_MAX_AGE_DAYS = 30
+
+COPY_CHUNK = 1 << 20
+
+SUFFIXES = {".zst": "zstd", ".gz": "gzip"}
+
+###############################################################################
+# CODECS
+###############################################################################
+
+def _zstd():
+    # optional dependency, only needed for .zst files
+    import zstandard
+    return zstandard
+
+
+def default_codec():
+    """
+    The codec new files are written with: "zstd", "gzip" or None.
+    """
+    if COMPRESSION == "none":
+        return None
+    if COMPRESSION in ("auto", "zstd"):
+        try:
+            _zstd()
+            return "zstd"
+        except ImportError:
+            if COMPRESSION == "zstd":
+                raise
+    return "gzip"
+
+
+def codec_of(path):
+    return SUFFIXES.get(os.path.splitext(path)[1])
+
+
+def suffix_for(codec):
+    for suffix, name in SUFFIXES.items():
+        if name == codec:
+            return suffix
+    return ""
+
+
+def resolve(path):
+    """
+    The file actually on disk for a logical path like downloaded_csv/query_123.csv:
+    the path itself, or its .zst / .gz version. Returns 'path' if none exists.
+    """
+    if os.path.exists(path):
+        return path
+    for suffix in SUFFIXES:
+        if os.path.exists(path + suffix):
+            return path + suffix
+    return path
+
+
+def exists(path):
+    return os.path.exists(resolve(path))
+
+
+def remove_variants(path, keep=None):
+    """
+    Remove every stored version of logical 'path' except 'keep', so an older
+    copy under another codec can't shadow the new one in resolve().
+    """
+    for candidate in [path] + [path + suffix for suffix in SUFFIXES]:
+        if candidate != keep and os.path.exists(candidate):
+            os.remove(candidate)
+
+###############################################################################
+# OPEN
+###############################################################################
+
+def open_binary(path, mode="rb"):
+    """
+    Binary file object for 'path', (de)compressing by its suffix.
+    mode: "rb", "wb" or "ab" (appending adds a new gzip member / zstd frame,
+    which readers treat as one continuous stream).
+    """
+    codec = codec_of(path)
+    if codec == "gzip":
+        return gzip.open(path, mode, compresslevel=GZIP_LEVEL)
+    if codec == "zstd":
+        zstd = _zstd()
+        raw = open(path, mode)
+        if mode == "rb":
+            reader = zstd.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+            # BufferedReader gives us a C-speed readline()
+            return io.BufferedReader(reader, buffer_size=COPY_CHUNK)
+        return zstd.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw)
+    return open(path, mode)
+
+
+def open_text(path, mode="r"):
+    """
+    Text (utf-8, newline="" for the csv module) version of open_binary().
+    """
+    return io.TextIOWrapper(open_binary(path, mode[0] + "b"), encoding="utf-8", newline="")
+
+###############################################################################
+# COMPRESS / APPEND
+###############################################################################
+
+def _copy_lines(src, out):
+    """
+    Copy src to out, adding a final newline if the data lacks one (Query
+    Runner exports don't always end with one, and appended rows would
+    otherwise run into the last line).
+    """
+    last = b""
+    for chunk in iter(lambda: src.read(COPY_CHUNK), b""):
+        out.write(chunk)
+        last = chunk[-1:]
+    if last and last != b"\n":
+        out.write(b"\n")
+
+
+def compress_file(path, codec=None):
+    """
+    Stream-compress a freshly downloaded file next to itself and remove the
+    original. Returns the new path (or 'path' unchanged if compression is off
+    or it is already compressed).
+    """
+    codec = codec or default_codec()
+    if codec is None or codec_of(path):
+        return path
+    suffix = suffix_for(codec)
+    dest = path + suffix
+    # keep the codec suffix on the temp name so open_binary() picks the codec
+    tmp = f"{path}.tmp{suffix}"
+    with open(path, "rb") as src, open_binary(tmp, "wb") as out:
+        _copy_lines(src, out)
+    os.replace(tmp, dest)
+    remove_variants(path, keep=dest)
+    return dest
+
+
+def append_csv_rows(src_path, dest_path):
+    """
+    Append src's data rows (header skipped) to dest, or move src to dest if
+    dest doesn't exist. dest_path is the logical (uncompressed) name; the
+    result keeps src's compression. Returns the path written.
+    """
+    dest = resolve(dest_path)
+    if not os.path.exists(dest):
+        dest = dest_path + suffix_for(codec_of(src_path))
+        os.replace(src_path, dest)
+        return dest
+    if not codec_of(dest):
+        # compressed files always end with a newline (see _copy_lines), plain ones may not
+        with open(dest, "rb+") as f:
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+    with open_binary(src_path) as src, open_binary(dest, "ab") as out:
+        src.readline()
+        _copy_lines(src, out)
+    os.remove(src_path)
+    return dest
+
+
+def read_csv_rows(path):
+    """
+    All rows of a (possibly compressed) CSV as dicts.
+    """
+    with open_text(resolve(path)) as f:
+        return list(csv.DictReader(f))
+
+###############################################################################
+# RETENTION
+###############################################################################
+
+def enforce_retention(directory, max_bytes=RETENTION_MAX_BYTES, max_age_days=RETENTION_MAX_AGE_DAYS):
+    """
+    Delete files in 'directory' older than max_age_days, then the oldest ones
+    until the total is under max_bytes. Dotfiles are left alone.
+    Returns (files_removed, bytes_freed).
+    """
+    if not os.path.isdir(directory):
+        return 0, 0
+    files = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and not entry.name.startswith("."):
+            st = entry.stat()
+            files.append((st.st_mtime, st.st_size, entry.path))
+    files.sort()
+
+    cutoff = time.time() - max_age_days * 86400 if max_age_days else None
+    total = sum(size for _, size, _ in files)
+    removed = freed = 0
+    for mtime, size, path in files:
+        too_old = cutoff is not None and mtime < cutoff
+        too_big = max_bytes is not None and total > max_bytes
+        if not (too_old or too_big):
+            break
+        os.remove(path)
+        total -= size
+        removed += 1
+        freed += size
+    if removed:
+        print(f"Retention: removed {removed} files ({freed / 1024 ** 2:.1f} MB) from {directory}.")
+    return removed, freed
+
+###############################################################################
+# MAIN SCRIPT
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage compressed query exports.")
+    parser.add_argument("command", choices=["compress", "prune", "stats"])
+    parser.add_argument("directory", nargs="?", default="downloaded_csv")
+    args = parser.parse_args()
+
+    if args.command == "compress":
+        before = after = n = 0
+        for entry in sorted(os.scandir(args.directory), key=lambda e: e.name):
+            if entry.is_file() and entry.name.endswith(".csv"):
+                before += entry.stat().st_size
+                after += os.path.getsize(compress_file(entry.path))
+                n += 1
+        print(f"Compressed {n} files: {before / 1024 ** 2:.1f} MB -> {after / 1024 ** 2:.1f} MB.")
+    elif args.command == "prune":
+        enforce_retention(args.directory)
+    else:
+        by_codec = {}
+        for entry in os.scandir(args.directory):
+            if entry.is_file() and not entry.name.startswith("."):
+                key = codec_of(entry.name) or "plain"
+                count, size = by_codec.get(key, (0, 0))
+                by_codec[key] = (count + 1, size + entry.stat().st_size)
+        for key, (count, size) in sorted(by_codec.items()):
+            print(f"  {key}: {count} files, {size / 1024 ** 2:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
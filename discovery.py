@@ -0,0 +1,85 @@
+from collections import defaultdict
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+# Stop once this many consecutive rows produced no new (domain, pattern)
+DISCOVERY_WINDOW = 2000
+
+# ...but never before this many rows have been read
+DISCOVERY_MIN_ROWS = 1000
+
+###############################################################################
+# CONVERGENCE MONITOR
+###############################################################################
+
+class ConvergenceMonitor:
+    """
+    Watches the stream of (domain, pattern) pairs for one tracker and says when
+    pattern discovery has stopped producing anything new.
+
+    converged: no new pattern in any domain over the last 'window' rows
+    (and at least 'min_rows' rows seen).
+
+    confidence(): Good-Turing coverage estimate, 1 - n1/N, where n1 is the
+    number of patterns seen exactly once so far and N the rows observed; i.e.
+    the estimated chance that the next row's pattern is one we already have.
+    """
+    def __init__(self, window=DISCOVERY_WINDOW, min_rows=DISCOVERY_MIN_ROWS):
+        self.window = window
+        self.min_rows = min_rows
+        self.rows = 0
+        self.rows_since_new = 0
+        # (domain, pattern) -> times seen
+        self.seen = {}
+        # domain -> {"rows", "patterns", "last_new_row"}
+        self.domains = defaultdict(lambda: {"rows": 0, "patterns": 0, "last_new_row": 0})
+
+    def observe(self, domain, pattern):
+        """
+        Record one row. Returns True if it produced a new pattern.
+        """
+        self.rows += 1
+        stats = self.domains[domain]
+        stats["rows"] += 1
+        key = (domain, pattern)
+        count = self.seen.get(key, 0)
+        self.seen[key] = count + 1
+        if count:
+            self.rows_since_new += 1
+            return False
+        stats["patterns"] += 1
+        stats["last_new_row"] = self.rows
+        self.rows_since_new = 0
+        return True
+
+    @property
+    def converged(self):
+        return self.rows >= self.min_rows and self.rows_since_new >= self.window
+
+    def confidence(self):
+        if not self.rows:
+            return 0.0
+        singletons = sum(1 for c in self.seen.values() if c == 1)
+        return 1.0 - singletons / self.rows
+
+    def new_rate_upper_bound(self):
+        """
+        95% upper bound on the per-row chance of a new pattern, from the
+        current run of rows without one ("rule of three").
+        """
+        if not self.rows_since_new:
+            return 1.0
+        return min(1.0, 3.0 / self.rows_since_new)
+
+    def report(self):
+        """
+        One-line summary for the log.
+        """
+        return (
+            f"{self.rows} rows, {len(self.seen)} patterns over {len(self.domains)} domains, "
+            f"{self.rows_since_new} rows since last new pattern, "
+            f"coverage ~{self.confidence():.1%}, "
+            f"new-pattern rate <= {self.new_rate_upper_bound():.2%} (95%)"
+        )
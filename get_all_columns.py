@@ -6,14 +6,10 @@ import json
 from collections import defaultdict
 from urllib.parse import urlparse
 
-from selenium import webdriver
-from selenium.common.exceptions import ElementClickInterceptedException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.webdriver.support.ui import Select, WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from csv_store import enforce_retention, open_text
+from query_session import QueryRunnerSession, make_driver
+from schema_catalog import connect as connect_catalog, prune_tables, upsert_table
+from tracing import Tracer
 
 ###############################################################################
 # CONFIG
@@ -41,137 +37,24 @@ CHROME_PROFILE_DIR = os.path.abspath("my_chrome_profile")
 
 FINAL_CSV_PATH = "all_tables_all_columns.csv"
 
+tracer = Tracer("get_all_columns")
+
 ###############################################################################
 # SELENIUM SETUP
 ###############################################################################
 
-chrome_options = Options()
-chrome_options.add_argument(f"--user-data-dir={CHROME_PROFILE_DIR}")
-chrome_options.add_experimental_option("prefs", {
-    "download.default_directory": DOWNLOAD_DIR,
-    "download.prompt_for_download": False,
-    "download.directory_upgrade": True,
-    "plugins.always_open_pdf_externally": True
-})
+driver = make_driver(DOWNLOAD_DIR, CHROME_PROFILE_DIR)
 
-driver = webdriver.Chrome(options=chrome_options)
-
-###############################################################################
-# HELPER FUNCTIONS
-###############################################################################
-
-def find_submit_button():
-    """
-    Try multiple locators for the 'Submit' or 'Run Query' button.
-    """
-    locators = [
-        (By.XPATH, "//input[@value='Submit']"),
-        (By.XPATH, "//button[contains(text(),'Submit')]"),
-        (By.ID, "submitBtn"),
-        (By.XPATH, "//input[@value='Run Query']"),
-        (By.XPATH, "//button[contains(text(),'Run Query')]"),
-    ]
-    for how, what in locators:
-        try:
-            return driver.find_element(how, what)
-        except:
-            pass
-    return None
-
-def clear_and_type_sql(sql_query):
-    """
-    Clear the CodeMirror area and type in the given SQL query.
-    """
-    code_mirror_area = None
-    try:
-        code_mirror_area = driver.find_element(By.CSS_SELECTOR, ".CodeMirror-code")
-    except:
-        code_mirror_area = driver.find_element(By.CSS_SELECTOR, ".CodeMirror")
-
-    code_mirror_area.click()
-    time.sleep(0.5)
-    actions = ActionChains(driver)
-    actions.key_down(Keys.CONTROL).send_keys("a").key_up(Keys.CONTROL)
-    actions.send_keys(Keys.DELETE)
-    actions.send_keys(sql_query)
-    actions.perform()
-
-def run_query_and_download_csv(sql_query, datasource, filename_prefix):
-    """
-    Select the given datasource, enter sql_query, run it, and download the CSV file.
-    Returns the path to the downloaded CSV or None if something failed.
-    """
-    # Re-select data source
-    try:
-        ds_elem = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "select#dataSourceSelect"))
-        )
-        Select(ds_elem).select_by_value(datasource)
-    except Exception as e:
-        print(f"  Could not set data source to {datasource}: {e}")
-        return None
-
-    # Set maxRecords
-    try:
-        max_records_input = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "maxRecords"))
-        )
-        max_records_input.clear()
-        max_records_input.send_keys(str(MAX_RECORDS))
-    except:
-        print("  #maxRecords field not found.")
-        return None
-
-    # Enter the SQL
-    clear_and_type_sql(sql_query)
-
-    # Submit the query
-    submit_btn = find_submit_button()
-    if not submit_btn:
-        print("  ERROR: No submit button.")
-        return None
-
-    # Click 'Submit'
-    try:
-        submit_btn.click()
-    except ElementClickInterceptedException:
-        print("  Submit intercepted, waiting then retrying.")
-        time.sleep(5)
-        try:
-            submit_btn.click()
-        except ElementClickInterceptedException:
-            print("  Still failing, skipping.")
-            return None
-
-    # Wait for query to run
-    print("  Waiting for query to run (10-20s)...")
-    time.sleep(10)
-
-    # Select CSV radio
-    try:
-        csv_radio = driver.find_element(By.ID, "view_csv")
-        csv_radio.click()
-    except:
-        print("  Could not select CSV radio.")
-        return None
-
-    time.sleep(3)
-    csv_path = os.path.join(DOWNLOAD_DIR, "query.csv")
-    final_path = os.path.join(DOWNLOAD_DIR, f"{filename_prefix}.csv")
-
-    time.sleep(2)
-    if os.path.exists(csv_path):
-        os.rename(csv_path, final_path)
-        return final_path
-    else:
-        print(f"  CSV not found at {csv_path}")
-        return None
+# Keeps the page loaded between queries; only refreshed after an error
+session = QueryRunnerSession(driver, DATA_SOURCES[0], MAX_RECORDS, tracer=tracer)
 
 ###############################################################################
 # MAIN SCRIPT
 ###############################################################################
 
 def main():
+    # Local copy of the results for schema_catalog.py search, updated per table
+    catalog = connect_catalog()
     try:
         # 1) Go to Query Runner
         print(f"Navigating to {OPERATOR_QUERY_URL} ...")
@@ -180,18 +63,19 @@ def main():
         # 2) Wait for manual login if needed
         input("\nLog in if needed. Press Enter once fully loaded...")
 
+        enforce_retention(DOWNLOAD_DIR)
+
         # Data structure to hold [ (datasource, table_name, column_name, column_type, etc.)... ]
         all_columns_data = []
 
         # 3) For each data source
         for ds in DATA_SOURCES:
             print(f"\n=== Data Source: {ds} ===")
-            driver.refresh()
-            time.sleep(2)
 
             # 3.1) "SHOW TABLES"
-            show_tables_csv = run_query_and_download_csv(
-                SHOW_TABLES_SQL, ds, filename_prefix=f"show_tables_{ds}"
+            show_tables_csv = session.run_query(
+                SHOW_TABLES_SQL, DOWNLOAD_DIR, f"show_tables_{ds}.csv",
+                data_source=ds, wait_seconds=10, tracker=ds
             )
             if not show_tables_csv:
                 print(f"Skipping data source {ds} due to error.")
@@ -199,7 +83,9 @@ def main():
 
             # 3.2) Parse the list of tables
             tables_list = []
-            with open(show_tables_csv, "r", encoding="utf-8") as f:
+            with tracer.span("parse", tracker=ds, file="show_tables") as sp, \
+                    open_text(show_tables_csv) as f:
+                sp.add(bytes=os.path.getsize(show_tables_csv))
                 # Some data sources return columns named e.g. "Tables_in_database"
                 reader = csv.reader(f)
                 header = next(reader, None)
@@ -214,6 +100,7 @@ def main():
                         table_name = table_name.strip()
                         if table_name:
                             tables_list.append(table_name)
+                sp.add(rows=len(tables_list))
 
             if not tables_list:
                 print(f"  No tables found for {ds}.")
@@ -224,10 +111,13 @@ def main():
             # 3.3) For each table: DESCRIBE or SHOW COLUMNS FROM
             for table_name in tables_list:
                 describe_sql = DESCRIBE_TABLE_SQL.format(TABLE_NAME=table_name)
-                describe_csv = run_query_and_download_csv(
+                describe_csv = session.run_query(
                     describe_sql,
-                    ds,
-                    filename_prefix=f"describe_{ds}_{table_name.replace('/', '_')}"
+                    DOWNLOAD_DIR,
+                    f"describe_{ds}_{table_name.replace('/', '_')}.csv",
+                    data_source=ds,
+                    wait_seconds=10,
+                    tracker=ds
                 )
                 if not describe_csv:
                     print(f"    Skipping table {table_name} due to error.")
@@ -236,9 +126,13 @@ def main():
                 # 3.4) Parse the DESCRIBE results
                 # Example columns from DESCRIBE table_name:
                 # Field, Type, Null, Key, Default, Extra
-                with open(describe_csv, "r", encoding="utf-8") as f:
+                with tracer.span("parse", tracker=ds, file="describe") as sp, \
+                        open_text(describe_csv) as f:
+                    sp.add(bytes=os.path.getsize(describe_csv))
+                    table_columns = []
                     desc_reader = csv.DictReader(f)
                     for desc_row in desc_reader:
+                        sp.add(rows=1)
                         # Grab columns you care about
                         field = desc_row.get("Field", "")
                         col_type = desc_row.get("Type", "")
@@ -246,6 +140,7 @@ def main():
                         key_info = desc_row.get("Key", "")
                         default_val = desc_row.get("Default", "")
                         extra = desc_row.get("Extra", "")
+                        table_columns.append((field, col_type, is_null, key_info, default_val, extra))
 
                         # Store in the big list
                         all_columns_data.append((
@@ -259,6 +154,11 @@ def main():
                             extra
                         ))
 
+                upsert_table(catalog, ds, table_name, table_columns)
+
+            # Drop tables that no longer exist in this data source
+            prune_tables(catalog, ds, tables_list)
+
         # 4) Write final CSV
         with open(FINAL_CSV_PATH, "w", newline="", encoding="utf-8") as out_f:
             writer = csv.writer(out_f)
@@ -270,11 +170,14 @@ def main():
                 writer.writerow(row_data)
 
         print(f"\nAll done. Wrote {len(all_columns_data)} column definitions to {FINAL_CSV_PATH}.")
+        tracer.summary()
 
         input("\nPress Enter to close...")
     finally:
         print("Closing browser.")
         driver.quit()
+        catalog.close()
+        tracer.close()
 
 if __name__ == "__main__":
     main()
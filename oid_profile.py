@@ -0,0 +1,287 @@
+import os
+import csv
+import json
+import argparse
+from collections import Counter
+
+from csv_store import default_codec, open_text, remove_variants, resolve, suffix_for
+from wide_csv import WideCsvReader
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+OID_PROFILE_CSV = "oid_profile.csv"
+
+# Prefixes kept per tracker in the profile
+TOP_PREFIXES = 20
+
+# Same length as LEFT(oid, 3)
+PREFIX_LENGTH = 3
+
+###############################################################################
+# DERIVED COLUMNS
+###############################################################################
+# These reproduce what SQL_TEMPLATE used to compute server-side:
+#
+#   CASE WHEN oid REGEXP '^[0-9]+$'        THEN 'Numeric'
+#        WHEN oid REGEXP '^[A-Za-z]+$'     THEN 'Alphabetic'
+#        WHEN oid REGEXP '^[A-Za-z0-9]+$'  THEN 'Alphanumeric'
+#        ELSE 'Special Characters Present' END          -> oid_type
+#   LENGTH(oid)                                          -> oid_length (bytes)
+#   LEFT(oid, 3)                                         -> prefix
+#   CASE on method LIKE ... / json LIKE '%jsver%'        -> sub_method
+#
+# str.isdigit()/isalpha()/isalnum() also accept non-ASCII letters and digits,
+# so they're only trusted together with isascii().
+
+def oid_type(oid):
+    if oid.isascii():
+        if oid.isdigit():
+            return "Numeric"
+        if oid.isalpha():
+            return "Alphabetic"
+        if oid.isalnum():
+            return "Alphanumeric"
+    return "Special Characters Present"
+
+
+def oid_length(oid):
+    # LENGTH() counts bytes, not characters
+    return len(oid) if oid.isascii() else len(oid.encode("utf-8"))
+
+
+def sub_method(method, has_jsver):
+    """
+    has_jsver: the row's (json LIKE '%jsver%'). LIKE is case-insensitive,
+    hence the upper().
+    """
+    m = method.upper()
+    if "XHR" in m or "BEACON" in m or ("PIXEL" in m and has_jsver):
+        return "utt"
+    if "API" in m:
+        return "conv_api"
+    if "BATCH" in m:
+        return "ftp"
+    return "other"
+
+
+def _truthy(val):
+    if isinstance(val, bytes):
+        val = val.decode("utf-8", errors="replace")
+    return val.strip().lower() in ("1", "true", "t", "yes")
+
+
+def derive_columns(oids, methods, jsvers=None, sub_methods=None):
+    """
+    One pass over a batch of raw values; returns
+    {"oid_type", "oid_length", "prefix", "sub_method"} lists, row-aligned.
+    If the batch already has a sub_method column (older exports), it's used
+    as-is instead of method/jsver.
+    """
+    types = [oid_type(o) for o in oids]
+    lengths = [oid_length(o) for o in oids]
+    prefixes = [o[:PREFIX_LENGTH] for o in oids]
+    if sub_methods is not None:
+        subs = list(sub_methods)
+    else:
+        if jsvers is None:
+            jsvers = [""] * len(methods)
+        # only a handful of distinct methods, so memoize per (method, jsver)
+        memo = {}
+        subs = []
+        for m, j in zip(methods, jsvers):
+            key = (m, j)
+            val = memo.get(key)
+            if val is None:
+                val = memo[key] = sub_method(m, _truthy(j))
+            subs.append(val)
+    return {"oid_type": types, "oid_length": lengths, "prefix": prefixes, "sub_method": subs}
+
+###############################################################################
+# PER-TRACKER PROFILE
+###############################################################################
+
+class OidProfile:
+    """
+    Distribution of one tracker's OIDs: type mix, length histogram, top
+    prefixes and sub_method mix.
+    """
+    def __init__(self):
+        self.rows = 0
+        self.types = Counter()
+        self.lengths = Counter()
+        self.prefixes = Counter()
+        self.sub_methods = Counter()
+
+    def add(self, oid_type_, length, prefix, sub):
+        self.rows += 1
+        self.types[oid_type_] += 1
+        self.lengths[length] += 1
+        self.prefixes[prefix] += 1
+        self.sub_methods[sub] += 1
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.types.update(other.types)
+        self.lengths.update(other.lengths)
+        self.prefixes.update(other.prefixes)
+        self.sub_methods.update(other.sub_methods)
+        return self
+
+    def to_dict(self):
+        return {
+            "rows": self.rows,
+            "types": self.types,
+            # JSON keys are strings; from_dict() turns them back into ints
+            "lengths": {str(k): v for k, v in self.lengths.items()},
+            "prefixes": self.prefixes,
+            "sub_methods": self.sub_methods,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        prof = cls()
+        prof.rows = d["rows"]
+        prof.types = Counter(d["types"])
+        prof.lengths = Counter({int(k): v for k, v in d["lengths"].items()})
+        prof.prefixes = Counter(d["prefixes"])
+        prof.sub_methods = Counter(d["sub_methods"])
+        return prof
+
+    def dominant_type(self):
+        return self.types.most_common(1)[0][0] if self.types else ""
+
+    def length_range(self):
+        if not self.lengths:
+            return "", ""
+        return min(self.lengths), max(self.lengths)
+
+    def to_row(self, tracker_id):
+        min_len, max_len = self.length_range()
+        return [
+            tracker_id,
+            self.rows,
+            self.dominant_type(),
+            json.dumps(dict(self.types.most_common())),
+            min_len,
+            max_len,
+            json.dumps({str(k): v for k, v in sorted(self.lengths.items())}),
+            json.dumps(dict(self.prefixes.most_common(TOP_PREFIXES))),
+            json.dumps(dict(self.sub_methods.most_common())),
+        ]
+
+
+# Per-row columns written by profile_csv(derived_path=...), what SQL_TEMPLATE
+# used to return alongside each export row
+DERIVED_HEADER = ["action_tracker_id", "oid", "oid_type", "oid_length", "prefix", "sub_method"]
+
+PROFILE_HEADER = [
+    "action_tracker_id", "rows", "dominant_type", "type_mix", "min_length",
+    "max_length", "length_histogram", "top_prefixes", "sub_methods",
+]
+
+
+def _header(path):
+    with open_text(path) as f:
+        header = next(csv.reader(f), [])
+    return [h.strip().lstrip("\ufeff") for h in header]
+
+
+def profile_csv(csv_path, profiles, tracker=None, limit=None, derived_path=None):
+    """
+    Add every row of a query CSV (plain or compressed) to profiles
+    {action_tracker_id: OidProfile}. Rows are keyed by their own
+    action_tracker_id column, so multi-tracker batch files work too;
+    'tracker' is used if the file has no such column.
+    With 'limit', only the first 'limit' rows are read.
+    With 'derived_path' (a logical .csv name, compressed like the downloads),
+    each profiled row's DERIVED_HEADER columns are written there too.
+    Returns the number of rows profiled.
+    """
+    path = resolve(csv_path)
+    header = set(_header(path))
+    if "oid" not in header:
+        return 0
+    columns = ["oid", "method"]
+    for optional in ("action_tracker_id", "has_jsver", "sub_method"):
+        if optional in header:
+            columns.append(optional)
+
+    out_f = writer = None
+    if derived_path:
+        out_path = derived_path + suffix_for(default_codec())
+        remove_variants(derived_path, keep=out_path)
+        out_f = open_text(out_path, "w")
+        writer = csv.writer(out_f)
+        writer.writerow(DERIVED_HEADER)
+
+    rows = 0
+    try:
+        for batch in WideCsvReader(path, columns):
+            if limit is not None:
+                if rows >= limit:
+                    break
+                if rows + batch["_rows"] > limit:
+                    keep = limit - rows
+                    batch = {k: v[:keep] for k, v in batch.items() if k != "_rows"}
+                    batch["_rows"] = keep
+            derived = derive_columns(
+                batch["oid"],
+                batch["method"],
+                jsvers=batch.get("has_jsver"),
+                sub_methods=batch.get("sub_method"),
+            )
+            tids = [str(tid).strip() for tid in batch.get("action_tracker_id") or [tracker] * batch["_rows"]]
+            for tid, t, n, p, s in zip(tids, derived["oid_type"], derived["oid_length"],
+                                       derived["prefix"], derived["sub_method"]):
+                prof = profiles.get(tid)
+                if prof is None:
+                    prof = profiles[tid] = OidProfile()
+                prof.add(t, n, p, s)
+            if writer is not None:
+                writer.writerows(zip(tids, batch["oid"], derived["oid_type"], derived["oid_length"],
+                                     derived["prefix"], derived["sub_method"]))
+            rows += batch["_rows"]
+    finally:
+        if out_f is not None:
+            out_f.close()
+    return rows
+
+
+def write_profiles(profiles, path=OID_PROFILE_CSV):
+    def sort_key(tid):
+        return (0, int(tid)) if tid.isdigit() else (1, tid)
+
+    with open(path, "w", newline="", encoding="utf-8") as out_f:
+        writer = csv.writer(out_f)
+        writer.writerow(PROFILE_HEADER)
+        for tid in sorted(profiles, key=sort_key):
+            writer.writerow(profiles[tid].to_row(tid))
+
+###############################################################################
+# MAIN SCRIPT
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-tracker OID profile of query exports.")
+    parser.add_argument("paths", nargs="+", help="query CSVs (plain, .zst or .gz)")
+    parser.add_argument("--out", default=OID_PROFILE_CSV)
+    args = parser.parse_args()
+
+    profiles = {}
+    total = 0
+    for path in args.paths:
+        tracker = os.path.basename(path).split(".")[0].replace("query_", "")
+        total += profile_csv(path, profiles, tracker=tracker)
+    write_profiles(profiles, args.out)
+    print(f"Profiled {total} rows for {len(profiles)} trackers -> {args.out}")
+    for tid in sorted(profiles):
+        prof = profiles[tid]
+        min_len, max_len = prof.length_range()
+        print(f"  {tid}: {prof.rows} rows, {prof.dominant_type()}, length {min_len}-{max_len}, "
+              f"top prefixes {[p for p, _ in prof.prefixes.most_common(3)]}")
+
+
+if __name__ == "__main__":
+    main()
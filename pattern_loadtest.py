@@ -0,0 +1,208 @@
+import os
+import re
+import csv
+import json
+import glob
+import time
+import random
+import socket
+import argparse
+import threading
+import http.client
+from urllib.parse import quote
+
+from pattern_service import HOST, PORT, VARIATIONS_CSV
+from wide_csv import iter_column_rows
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+REQUESTS = 20000
+CONCURRENCY = 8
+BATCH_SIZE = 100
+
+# Share of generated URLs that shouldn't match anything
+MISS_RATIO = 0.2
+
+# Pattern pieces -> sample text, for building URLs from final_url_variations.csv
+SAMPLE_PARTS = [
+    ("(?:/.*)?", ""),
+    ("[0-9]+", "12345"),
+    ("[A-Za-z]+", "abc"),
+    ("[A-Za-z0-9]+", "a1b2"),
+    ("[^/]+", "x-1"),
+]
+
+###############################################################################
+# URL SOURCES
+###############################################################################
+
+def sample_path(pattern):
+    path = pattern
+    for part, sample in SAMPLE_PARTS:
+        path = path.replace(part, sample)
+    # whatever is left is re.escape()d literal text
+    return re.sub(r"\\(.)", r"\1", path)
+
+
+def urls_from_variations(path, n):
+    """
+    URLs that should hit: one per (domain, pattern), plus some that shouldn't.
+    """
+    base = []
+    with open(path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            try:
+                patterns = json.loads(row["patterns"])
+            except ValueError:
+                continue
+            for pat in patterns:
+                base.append(f"https://{row['domain']}{sample_path(pat)}")
+    if not base:
+        return []
+    urls = []
+    for _ in range(n):
+        if random.random() < MISS_RATIO:
+            urls.append(f"https://nomatch-{random.randint(0, 10 ** 6)}.example/some/path")
+        else:
+            urls.append(random.choice(base))
+    return urls
+
+
+def urls_from_downloads(directory, n):
+    urls = []
+    for path in sorted(glob.glob(os.path.join(directory, "query_*.csv*"))):
+        try:
+            for (page_url,) in iter_column_rows(path, ["pageUrl"]):
+                if page_url:
+                    urls.append(page_url)
+                    if len(urls) >= n:
+                        return urls
+        except KeyError:
+            continue  # not a pageUrl export
+    return urls
+
+###############################################################################
+# CLIENT
+###############################################################################
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.unix_path)
+
+
+class NoDelayHTTPConnection(http.client.HTTPConnection):
+    def connect(self):
+        super().connect()
+        # POST headers and body are sent separately (see Handler.disable_nagle_algorithm)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def connect(args):
+    if args.unix:
+        return UnixHTTPConnection(args.unix)
+    return NoDelayHTTPConnection(args.host, args.port)
+
+
+def request(conn, method, path, body=None):
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    conn.request(method, path, body=body, headers=headers)
+    resp = conn.getresponse()
+    data = resp.read()
+    return resp.status, data
+
+
+def worker(args, urls, latencies, errors):
+    conn = connect(args)
+    try:
+        if args.batch:
+            for i in range(0, len(urls), args.batch_size):
+                chunk = urls[i:i + args.batch_size]
+                start = time.perf_counter()
+                status, _ = request(conn, "POST", "/lookup", json.dumps({"urls": chunk}))
+                latencies.append(time.perf_counter() - start)
+                if status != 200:
+                    errors.append(status)
+        else:
+            for url in urls:
+                start = time.perf_counter()
+                status, _ = request(conn, "GET", "/lookup?url=" + quote(url, safe=""))
+                latencies.append(time.perf_counter() - start)
+                if status != 200:
+                    errors.append(status)
+    finally:
+        conn.close()
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+###############################################################################
+# MAIN SCRIPT
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for pattern_service.py.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--unix", help="Unix socket path of the service")
+    parser.add_argument("--requests", type=int, default=REQUESTS, help="total URLs to look up")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--batch", action="store_true", help="POST batches instead of one GET per URL")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--urls", help="file with one URL per line")
+    parser.add_argument("--from-downloads", help="take pageUrl values from this downloaded_csv dir")
+    parser.add_argument("--variations", default=VARIATIONS_CSV)
+    args = parser.parse_args()
+
+    if args.urls:
+        with open(args.urls, "r", encoding="utf-8") as f:
+            urls = [line.strip() for line in f if line.strip()]
+    elif args.from_downloads:
+        urls = urls_from_downloads(args.from_downloads, args.requests)
+    else:
+        urls = urls_from_variations(args.variations, args.requests)
+    if not urls:
+        print("No URLs to send.")
+        return
+    urls = (urls * (args.requests // len(urls) + 1))[:args.requests]
+
+    latencies, errors = [], []
+    threads = [
+        threading.Thread(target=worker, args=(args, urls[i::args.concurrency], latencies, errors))
+        for i in range(args.concurrency)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    mode = f"batch of {args.batch_size}" if args.batch else "single"
+    print(f"{len(urls)} lookups ({mode}, {args.concurrency} connections) in {elapsed:.2f}s "
+          f"-> {len(urls) / elapsed:,.0f} URLs/s, {len(errors)} errors")
+    print("Client latency per request: "
+          f"p50 {percentile(latencies, 0.5) * 1e3:.2f} ms, "
+          f"p95 {percentile(latencies, 0.95) * 1e3:.2f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1e3:.2f} ms")
+
+    conn = connect(args)
+    try:
+        _, data = request(conn, "GET", "/stats")
+    finally:
+        conn.close()
+    stats = json.loads(data)
+    print("Server latency:", json.dumps(stats["latency"]))
+    print("URL cache:", json.dumps(stats["url_cache"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,487 @@
+import os
+import re
+import csv
+import json
+import time
+import argparse
+import threading
+import socketserver
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+VARIATIONS_CSV = "final_url_variations.csv"
+TRACKER_REGEX_CSV = "tracker_regex.csv"
+
+HOST = "127.0.0.1"
+PORT = 8765
+
+# How often the CSVs' mtimes are checked. A changed file is only reloaded once
+# its size/mtime have stayed the same for one more interval, so a file that is
+# still being written is never loaded half-way.
+RELOAD_INTERVAL = 2.0
+
+# Results cached per URL (LRU)
+URL_CACHE_SIZE = 100000
+
+# Compiled full tracker regexes kept (LRU); these alternations are big
+TRACKER_REGEX_CACHE_SIZE = 256
+
+# Latencies kept per endpoint for the percentiles in /stats
+LATENCY_WINDOW = 10000
+
+# Max URLs in one batched lookup
+MAX_BATCH = 10000
+
+###############################################################################
+# HELPERS
+###############################################################################
+
+class LRUCache:
+    """
+    Small thread-safe LRU with hit/miss counters.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            try:
+                val = self.data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return val
+
+    def put(self, key, val):
+        with self.lock:
+            self.data[key] = val
+            self.data.move_to_end(key)
+            if len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self.data),
+            "capacity": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class LatencyStats:
+    """
+    Per-endpoint request counts and latency percentiles (microseconds) over
+    the last LATENCY_WINDOW requests.
+    """
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self.samples = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, seconds):
+        with self.lock:
+            if endpoint not in self.samples:
+                self.samples[endpoint] = deque(maxlen=self.window)
+                self.counts[endpoint] = 0
+            self.samples[endpoint].append(seconds * 1e6)
+            self.counts[endpoint] += 1
+
+    def report(self):
+        with self.lock:
+            snapshot = {ep: sorted(s) for ep, s in self.samples.items()}
+            counts = dict(self.counts)
+        out = {}
+        for ep, s in snapshot.items():
+            def pct(q):
+                return round(s[min(len(s) - 1, int(q * len(s)))], 1)
+            out[ep] = {
+                "requests": counts[ep],
+                "p50_us": pct(0.50),
+                "p95_us": pct(0.95),
+                "p99_us": pct(0.99),
+                "max_us": round(s[-1], 1),
+            }
+        return out
+
+
+def split_url(url):
+    """
+    (host, rest) as the tracker regex sees them: host lowercased with any port
+    dropped, rest = everything after the host (path, query, fragment).
+    None if it isn't an http(s) URL.
+    """
+    url = url.strip()
+    scheme_end = url.find("://")
+    if scheme_end < 0 or url[:scheme_end].lower() not in ("http", "https"):
+        return None
+    start = scheme_end + 3
+    end = len(url)
+    for sep in "/?#":
+        i = url.find(sep, start)
+        if 0 <= i < end:
+            end = i
+    host = url[start:end].lower().split(":")[0]
+    return host, url[end:]
+
+
+def host_candidates(host):
+    """
+    host itself and every parent domain: a.b.shop.com -> a.b.shop.com,
+    b.shop.com, shop.com, com (the regex allows any subdomain prefix).
+    """
+    parts = host.split(".")
+    return [".".join(parts[i:]) for i in range(len(parts))]
+
+###############################################################################
+# INDEX
+###############################################################################
+
+class PatternIndex:
+    """
+    Immutable snapshot of the pattern CSVs:
+      domains:  domain (without "www.") -> list of entries
+                {domain, tracker_ids, campaign_ids, patterns[(text, compiled)], combined}
+      trackers: tracker_id -> regex_for_regex101 text (compiled on first use)
+    Lookups never see a half-loaded index; reload builds a new one and swaps it in.
+    """
+    def __init__(self, sources):
+        self.sources = sources
+        self.domains = {}
+        self.tracker_regex = {}
+        self.bad_patterns = 0
+        # tracker id -> re.error message, for regexes that don't compile
+        self.tracker_regex_errors = {}
+        self.loaded_at = time.time()
+        self.url_cache = LRUCache(URL_CACHE_SIZE)
+        self.regex_cache = LRUCache(TRACKER_REGEX_CACHE_SIZE)
+
+    @classmethod
+    def load(cls, variations_csv=VARIATIONS_CSV, tracker_regex_csv=TRACKER_REGEX_CSV):
+        index = cls({p: file_signature(p) for p in (variations_csv, tracker_regex_csv)})
+        if os.path.exists(variations_csv):
+            with open(variations_csv, "r", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    index._add_domain_row(row)
+        if os.path.exists(tracker_regex_csv):
+            with open(tracker_regex_csv, "r", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    index.tracker_regex[row["action_tracker_dim_id"].strip()] = row["regex_for_regex101"]
+        return index
+
+    def _add_domain_row(self, row):
+        domain = row["domain"].strip().lower()
+        try:
+            pattern_list = json.loads(row["patterns"])
+        except ValueError:
+            pattern_list = []
+        patterns = []
+        for pat in sorted(set(pattern_list)):
+            try:
+                # same query-string tail the tracker regex puts after the domain block
+                patterns.append((pat, re.compile(pat + r"(?:\?.*)?")))
+            except re.error:
+                self.bad_patterns += 1
+        if not patterns:
+            return
+        combined = re.compile(
+            "(?:" + "|".join(p for p, _ in patterns) + r")(?:\?.*)?"
+        )
+        key = domain[4:] if domain.startswith("www.") else domain
+        self.domains.setdefault(key, []).append({
+            "domain": domain,
+            "tracker_ids": [t.strip() for t in row.get("action_tracker_ids", "").split(",") if t.strip()],
+            "campaign_ids": [c.strip() for c in row.get("campaign_ids", "").split(",") if c.strip()],
+            "patterns": patterns,
+            "combined": combined,
+        })
+
+    def lookup(self, url):
+        """
+        Returns (matches, cached). Each match: domain, action_tracker_ids,
+        campaign_ids and the path pattern that matched.
+        """
+        cached = self.url_cache.get(url)
+        if cached is not None:
+            return cached, True
+        matches = []
+        parts = split_url(url)
+        if parts is not None:
+            host, rest = parts
+            for candidate in host_candidates(host):
+                for entry in self.domains.get(candidate, ()):
+                    # one alternation to reject, then find which pattern it was
+                    if not entry["combined"].fullmatch(rest):
+                        continue
+                    matched = next(p for p, rx in entry["patterns"] if rx.fullmatch(rest))
+                    matches.append({
+                        "domain": entry["domain"],
+                        "action_tracker_ids": entry["tracker_ids"],
+                        "campaign_ids": entry["campaign_ids"],
+                        "pattern": matched,
+                    })
+        self.url_cache.put(url, matches)
+        return matches, False
+
+    def match_tracker(self, tracker_id, url):
+        """
+        Check url against one tracker's full regex from tracker_regex.csv.
+        None if the tracker isn't there; raises ValueError if its regex
+        doesn't compile (combine_tracker_regex.py only warns about those).
+        """
+        text = self.tracker_regex.get(tracker_id)
+        if text is None:
+            return None
+        compiled = self.regex_cache.get(tracker_id)
+        if compiled is None:
+            error = self.tracker_regex_errors.get(tracker_id)
+            if error is None:
+                try:
+                    # strip the /.../ delimiters and regex101 slash escaping
+                    compiled = re.compile(text[1:-1].replace(r"\/", "/"))
+                except re.error as e:
+                    # counted once per tracker, not per request
+                    if tracker_id not in self.tracker_regex_errors:
+                        self.bad_patterns += 1
+                    error = self.tracker_regex_errors.setdefault(tracker_id, str(e))
+            if error is not None:
+                raise ValueError(f"regex for tracker {tracker_id} doesn't compile: {error}")
+            self.regex_cache.put(tracker_id, compiled)
+        return compiled.match(url.strip()) is not None
+
+    def info(self):
+        return {
+            "domains": len(self.domains),
+            "domain_entries": sum(len(v) for v in self.domains.values()),
+            "trackers": len(self.tracker_regex),
+            "bad_patterns": self.bad_patterns,
+            "loaded_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.loaded_at)),
+            "sources": {p: sig is not None for p, sig in self.sources.items()},
+        }
+
+
+def file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+###############################################################################
+# SERVICE
+###############################################################################
+
+class PatternService:
+    """
+    Holds the current PatternIndex and swaps in a new one when the CSVs change.
+    """
+    def __init__(self, variations_csv=VARIATIONS_CSV, tracker_regex_csv=TRACKER_REGEX_CSV,
+                 reload_interval=RELOAD_INTERVAL):
+        self.paths = (variations_csv, tracker_regex_csv)
+        self.reload_interval = reload_interval
+        self.latency = LatencyStats()
+        self.reloads = 0
+        self.reload_errors = 0
+        self.last_reload_seconds = 0.0
+        self.index = None
+        self._stop = threading.Event()
+        self._reload()
+
+    def _reload(self):
+        start = time.perf_counter()
+        try:
+            new_index = PatternIndex.load(*self.paths)
+        except (OSError, KeyError, csv.Error) as e:
+            self.reload_errors += 1
+            print(f"Reload failed, keeping the previous index: {e}")
+            return False
+        # a single reference assignment: requests see the old or the new index
+        self.index = new_index
+        self.reloads += 1
+        self.last_reload_seconds = time.perf_counter() - start
+        info = new_index.info()
+        print(f"Loaded {info['domains']} domains, {info['trackers']} tracker regexes "
+              f"in {self.last_reload_seconds:.2f}s.")
+        return True
+
+    def watch(self):
+        """
+        Poll loop (run in a thread): reload once a changed file has settled.
+        """
+        pending = None
+        while not self._stop.wait(self.reload_interval):
+            current = {p: file_signature(p) for p in self.paths}
+            if current == self.index.sources or current[self.paths[0]] is None:
+                pending = None
+                continue
+            if current == pending:
+                self._reload()
+                pending = None
+            else:
+                pending = current
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        index = self.index
+        return {
+            "index": index.info(),
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "last_reload_seconds": round(self.last_reload_seconds, 3),
+            "url_cache": index.url_cache.stats(),
+            "tracker_regex_cache": index.regex_cache.stats(),
+            "latency": self.latency.report(),
+        }
+
+###############################################################################
+# HTTP
+###############################################################################
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    GET  /lookup?url=...                 -> {"url", "matches", "cached"}
+    POST /lookup  {"urls": [...]}        -> {"results": [...]}
+    GET  /tracker?id=...&url=...         -> {"tracker", "url", "match"}
+    GET  /stats                          -> index, cache and latency stats
+    POST /reload                         -> force a reload
+    """
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes; with Nagle on, keep-alive
+    # clients wait ~40ms for the delayed ACK on every request
+    disable_nagle_algorithm = True
+    service = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        start = time.perf_counter()
+        parsed = urlsplit(self.path)
+        query = parse_qs(parsed.query)
+        index = self.service.index
+        if parsed.path == "/lookup" and "url" in query:
+            url = query["url"][0]
+            matches, cached = index.lookup(url)
+            self._send(200, {"url": url, "matches": matches, "cached": cached})
+        elif parsed.path == "/tracker" and "id" in query and "url" in query:
+            try:
+                result = index.match_tracker(query["id"][0], query["url"][0])
+            except ValueError as e:
+                self._send(422, {"tracker": query["id"][0], "url": query["url"][0],
+                                 "match": None, "error": str(e)})
+                return
+            if result is None:
+                self._send(404, {"error": f"tracker {query['id'][0]} not in {TRACKER_REGEX_CSV}"})
+            else:
+                self._send(200, {"tracker": query["id"][0], "url": query["url"][0], "match": result})
+        elif parsed.path == "/stats":
+            self._send(200, self.service.stats())
+            return
+        else:
+            self._send(404, {"error": "unknown endpoint"})
+            return
+        self.service.latency.record(parsed.path, time.perf_counter() - start)
+
+    def do_POST(self):
+        start = time.perf_counter()
+        path = urlsplit(self.path).path
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if path == "/reload":
+            self._send(200, {"reloaded": self.service._reload()})
+            return
+        if path != "/lookup":
+            self._send(404, {"error": "unknown endpoint"})
+            return
+        try:
+            urls = json.loads(raw or b"{}").get("urls", [])
+        except (ValueError, AttributeError):
+            urls = None
+        if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+            self._send(400, {"error": "expected {\"urls\": [...]} with string URLs"})
+            return
+        if len(urls) > MAX_BATCH:
+            self._send(413, {"error": f"at most {MAX_BATCH} urls per request"})
+            return
+        index = self.service.index
+        results = []
+        for url in urls:
+            matches, cached = index.lookup(url)
+            results.append({"url": url, "matches": matches, "cached": cached})
+        self._send(200, {"results": results})
+        self.service.latency.record("/lookup[batch]", time.perf_counter() - start)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+###############################################################################
+# MAIN SCRIPT
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="URL -> tracker/pattern lookup service.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--unix", help="listen on this Unix socket path instead of TCP")
+    parser.add_argument("--variations", default=VARIATIONS_CSV)
+    parser.add_argument("--tracker-regex", default=TRACKER_REGEX_CSV)
+    parser.add_argument("--reload-interval", type=float, default=RELOAD_INTERVAL)
+    args = parser.parse_args()
+
+    service = PatternService(args.variations, args.tracker_regex, args.reload_interval)
+    Handler.service = service
+
+    if args.unix:
+        if os.path.exists(args.unix):
+            os.remove(args.unix)
+        server = UnixHTTPServer(args.unix, Handler)
+        where = args.unix
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), Handler)
+        where = f"http://{args.host}:{args.port}"
+
+    watcher = threading.Thread(target=service.watch, daemon=True)
+    watcher.start()
+    print(f"Serving on {where} (Ctrl+C to stop).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+
+
+if __name__ == "__main__":
+    main()
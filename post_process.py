@@ -5,12 +5,16 @@ import glob
 import pandas as pd
 from collections import defaultdict
 
+from csv_store import resolve
+from tracing import Tracer
+from wide_csv import iter_column_rows
+
 # -------------------------------------------------------------------
 # 0) CONFIG
 # -------------------------------------------------------------------
 
 # The directory containing query_{action_tracker_id}.csv files
-# (the same place your script downloaded them)
+# (the same place your script downloaded them; .csv.zst / .csv.gz work too)
 QUERY_CSV_DIR = "downloaded_csv"
 
 # The name of the final URL variations CSV from your Selenium flow
@@ -28,11 +32,15 @@ KEYWORDS = {
 
 # If you want partial substring ignoring case, we do: any kw.lower() in some_string.lower().
 
+tracer = Tracer("post_process")
+
 
 # -------------------------------------------------------------------
 # 1) LOAD final_url_variations.csv
 # -------------------------------------------------------------------
-df = pd.read_csv(FINAL_URL_VARIATIONS_CSV)
+with tracer.span("read_input") as sp:
+    df = pd.read_csv(FINAL_URL_VARIATIONS_CSV)
+    sp.add(rows=len(df), bytes=os.path.getsize(FINAL_URL_VARIATIONS_CSV))
 df = df.drop(columns=['total_rows', 'keyword_percent'])
 
 # We assume columns like:
@@ -104,9 +112,11 @@ def explode_trackers(row):
     return results
 
 expanded_rows = []
-for i, raw_row in df.iterrows():
-    subs = explode_trackers(raw_row)
-    expanded_rows.extend(subs)
+with tracer.span("explode") as sp:
+    for i, raw_row in df.iterrows():
+        subs = explode_trackers(raw_row)
+        expanded_rows.extend(subs)
+    sp.add(rows=len(expanded_rows))
 
 df_trackers = pd.DataFrame(expanded_rows)
 df_trackers.drop("action_tracker_ids", axis=1, inplace=True)
@@ -132,15 +142,17 @@ def flatten_unique(arrs):
             out.add(str(item).strip())
     return sorted(out)
 
-grouped = (
-    df_exploded
-    .groupby(["action_tracker_id","campaign_id"], as_index=False)
-    .agg({
-        "patterns": lambda c: flatten_unique(c),
-        "domain": lambda c: flatten_unique(c)
-        # if you have other columns to unify, add them here
-    })
-)
+with tracer.span("group") as sp:
+    grouped = (
+        df_exploded
+        .groupby(["action_tracker_id","campaign_id"], as_index=False)
+        .agg({
+            "patterns": lambda c: flatten_unique(c),
+            "domain": lambda c: flatten_unique(c)
+            # if you have other columns to unify, add them here
+        })
+    )
+    sp.add(rows=len(grouped))
 
 # columns => action_tracker_id, campaign_id, patterns, domain
 
@@ -182,20 +194,21 @@ def count_usage_in_csv(tracker_id, found_kws):
     Return (used_count, total_count).
     If no CSV found, return (0,0).
     """
-    path = os.path.join(QUERY_CSV_DIR, f"query_{tracker_id}.csv")
+    path = resolve(os.path.join(QUERY_CSV_DIR, f"query_{tracker_id}.csv"))
     if not os.path.exists(path):
         return (0,0)
     used_count = 0
     total_count = 0
     found_kws_lower = [k.lower() for k in found_kws]
-    with open(path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
+    with tracer.span("count_usage", tracker=tracker_id) as sp:
+        sp.add(bytes=os.path.getsize(path))
+        for (page_url,) in iter_column_rows(path, ["pageUrl"]):
             total_count += 1
-            page_url = (row.get("pageUrl","") or "").lower()
+            page_url = page_url.lower()
             # if ANY keyword is substring
             if any(kw in page_url for kw in found_kws_lower):
                 used_count += 1
+        sp.add(rows=total_count, matched=used_count)
     return (used_count, total_count)
 
 # We'll apply this row by row in the aggregator
@@ -243,5 +256,8 @@ grouped = grouped[final_cols]
 # -------------------------------------------------------------------
 
 grouped = grouped.rename(columns={'used_count':'rows_keyword_found_in', 'total_count':'total_rows', 'used_percent':'percent_keyword_match'})
-grouped.to_csv(OUTPUT_CSV, index=False)
-print(f"Done! Wrote {OUTPUT_CSV}")
\ No newline at end of file
+with tracer.span("write_output"):
+    grouped.to_csv(OUTPUT_CSV, index=False)
+print(f"Done! Wrote {OUTPUT_CSV}")
+tracer.summary()
+tracer.close()
\ No newline at end of file
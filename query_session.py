@@ -0,0 +1,298 @@
+import os
+import time
+
+from selenium import webdriver
+from selenium.common.exceptions import (
+    ElementClickInterceptedException,
+    NoSuchElementException,
+    StaleElementReferenceException,
+    TimeoutException,
+)
+from selenium.webdriver.common.by import By
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import Select, WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+from csv_store import compress_file
+from sql_entry import enter_sql
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+# Every element we touch on the Query Runner page, with fallbacks in the
+# order they should be tried. The one that worked last time is tried first.
+LOCATORS = {
+    "data_source": [
+        (By.CSS_SELECTOR, "select#dataSourceSelect"),
+    ],
+    "max_records": [
+        (By.ID, "maxRecords"),
+        (By.XPATH, "//input[@name='maxRecords']"),
+    ],
+    "submit": [
+        (By.XPATH, "//input[@value='Submit']"),
+        (By.XPATH, "//button[contains(text(),'Submit')]"),
+        (By.ID, "submitBtn"),
+        (By.XPATH, "//input[@value='Run Query']"),
+        (By.XPATH, "//button[contains(text(),'Run Query')]"),
+    ],
+    "csv_radio": [
+        (By.ID, "view_csv"),
+    ],
+}
+
+# Un-tick the CSV radio so the next click fires a fresh change/download
+RESET_RESULT_VIEW_JS = """
+var radio = document.getElementById('view_csv');
+if (radio) { radio.checked = false; }
+"""
+
+###############################################################################
+# SELENIUM SETUP
+###############################################################################
+
+def make_driver(download_dir, profile_dir):
+    """
+    Chrome with the shared profile, downloading CSVs into download_dir.
+    """
+    os.makedirs(download_dir, exist_ok=True)
+    chrome_options = Options()
+    chrome_options.add_argument(f"--user-data-dir={profile_dir}")
+    chrome_options.add_experimental_option("prefs", {
+        "download.default_directory": download_dir,
+        "download.prompt_for_download": False,
+        "download.directory_upgrade": True,
+        "plugins.always_open_pdf_externally": True
+    })
+    return webdriver.Chrome(options=chrome_options)
+
+###############################################################################
+# SESSION
+###############################################################################
+
+class QueryRunnerSession:
+    """
+    Keeps one Query Runner page loaded across queries.
+
+    prepare() only re-selects the data source / max records when they are not
+    already set, clears the result view, and refreshes the page only after
+    mark_error() was called. The editor isn't cleared; run_query() replaces
+    its whole contents. Located elements are cached and re-located
+    when they go stale.
+    """
+    def __init__(self, driver, data_source, max_records, tracer=None):
+        self.driver = driver
+        self.data_source = data_source
+        self.max_records = max_records
+        self.tracer = tracer
+        self.needs_refresh = False
+        # name -> WebElement
+        self._elements = {}
+        # name -> index into LOCATORS[name] that worked last
+        self._winning_locator = {}
+
+    ###########################################################################
+    # element cache
+    ###########################################################################
+
+    def _is_fresh(self, elem):
+        try:
+            elem.is_enabled()
+            return True
+        except StaleElementReferenceException:
+            return False
+
+    def _count(self, **counters):
+        if self.tracer is not None:
+            self.tracer.count("locate", **counters)
+
+    def find(self, name, timeout=0):
+        """
+        Return the element for 'name' (see LOCATORS) or None.
+        Uses the cached element if it is still attached to the page.
+        With timeout > 0 the first locator is waited on (page still loading).
+        """
+        elem = self._elements.get(name)
+        if elem is not None and self._is_fresh(elem):
+            self._count(cache_hits=1)
+            return elem
+
+        self._count(cache_misses=1)
+        self._elements.pop(name, None)
+
+        locators = list(enumerate(LOCATORS[name]))
+        first = self._winning_locator.get(name)
+        if first is not None:
+            locators.sort(key=lambda item: item[0] != first)
+
+        for i, (how, what) in locators:
+            try:
+                if timeout:
+                    elem = WebDriverWait(self.driver, timeout).until(
+                        EC.presence_of_element_located((how, what))
+                    )
+                else:
+                    elem = self.driver.find_element(how, what)
+            except (NoSuchElementException, TimeoutException):
+                # Only wait on the first locator; the fallbacks are instant.
+                timeout = 0
+                continue
+            self._elements[name] = elem
+            self._winning_locator[name] = i
+            return elem
+        return None
+
+    def invalidate(self):
+        self._elements.clear()
+
+    ###########################################################################
+    # page state
+    ###########################################################################
+
+    def refresh(self):
+        if self.tracer is not None:
+            with self.tracer.span("refresh"):
+                self.driver.refresh()
+            self.tracer.sleep(2, reason="after_refresh")
+        else:
+            self.driver.refresh()
+            time.sleep(2)
+        self.invalidate()
+        self.needs_refresh = False
+
+    def mark_error(self):
+        """
+        Something went wrong on the page; reload it before the next query.
+        """
+        self.needs_refresh = True
+
+    def ensure_data_source(self, data_source=None):
+        """
+        Select the data source only if it isn't already the selected one.
+        """
+        data_source = data_source or self.data_source
+        ds_elem = self.find("data_source", timeout=10)
+        if ds_elem is None:
+            print("  Could not find data source dropdown.")
+            return False
+        select = Select(ds_elem)
+        try:
+            current = select.first_selected_option.get_attribute("value")
+        except NoSuchElementException:
+            current = None
+        if current != data_source:
+            select.select_by_value(data_source)
+            print(f"  Data source set to {data_source}.")
+        return True
+
+    def ensure_max_records(self, max_records=None):
+        """
+        Type max records only if the field doesn't already hold that value.
+        """
+        max_records = max_records or self.max_records
+        max_records_input = self.find("max_records", timeout=10)
+        if max_records_input is None:
+            print("  #maxRecords field not found.")
+            return False
+        if max_records_input.get_attribute("value") != str(max_records):
+            max_records_input.clear()
+            max_records_input.send_keys(str(max_records))
+            print(f"  Set Max Records to {max_records}.")
+        return True
+
+    def reset_panes(self):
+        """
+        Clear the result view without reloading the page.
+        """
+        try:
+            self.driver.execute_script(RESET_RESULT_VIEW_JS)
+        except Exception as e:
+            print(f"  Could not reset result view: {e}")
+
+    def _prepare_page(self, data_source, max_records):
+        ok = (
+            self.ensure_data_source(data_source)
+            and self.ensure_max_records(max_records)
+        )
+        if ok:
+            self.reset_panes()
+        return ok
+
+    def prepare(self, data_source=None, max_records=None):
+        """
+        Get the page ready for the next query. Returns False if it can't be.
+        """
+        if self.needs_refresh:
+            print("  Refreshing page after previous error.")
+            self.refresh()
+        try:
+            ok = self._prepare_page(data_source, max_records)
+        except StaleElementReferenceException:
+            # Page changed under us; reload once and retry from scratch.
+            self.refresh()
+            ok = self._prepare_page(data_source, max_records)
+        if not ok:
+            self.mark_error()
+        return ok
+
+    ###########################################################################
+    # running a query
+    ###########################################################################
+
+    def _sleep(self, seconds, tracker=None, reason=""):
+        if self.tracer is not None:
+            self.tracer.sleep(seconds, tracker=tracker, reason=reason)
+        else:
+            time.sleep(seconds)
+
+    def run_query(self, sql_query, download_dir, filename, data_source=None,
+                  wait_seconds=20, tracker=None):
+        """
+        Prepare the page, enter + submit sql_query, pick the CSV view and move
+        the download (download_dir/query.csv) to download_dir/filename,
+        compressed on arrival (see csv_store.py; the returned path carries the
+        .zst/.gz suffix). Returns the final path, or None if any step failed.
+        """
+        if not self.prepare(data_source=data_source):
+            return None
+
+        enter_sql(self.driver, sql_query, tracer=self.tracer, tracker=tracker)
+
+        submit_btn = self.find("submit")
+        if not submit_btn:
+            print("  ERROR: No submit button.")
+            self.mark_error()
+            return None
+
+        try:
+            submit_btn.click()
+        except ElementClickInterceptedException:
+            print("  Submit intercepted, waiting then retrying.")
+            self._sleep(5, tracker, "submit_retry")
+            try:
+                submit_btn.click()
+            except ElementClickInterceptedException:
+                print("  Still failing, skipping.")
+                self.mark_error()
+                return None
+
+        print(f"  Waiting {wait_seconds}s for query to run...")
+        self._sleep(wait_seconds, tracker, "query_run")
+
+        try:
+            self.find("csv_radio").click()
+        except Exception:
+            print("  Could not select CSV radio.")
+            self.mark_error()
+            return None
+
+        self._sleep(5, tracker, "download")
+        csv_path = os.path.join(download_dir, "query.csv")
+        final_path = os.path.join(download_dir, filename)
+        if not os.path.exists(csv_path):
+            print(f"  CSV not found at {csv_path}")
+            self.mark_error()
+            return None
+        os.replace(csv_path, final_path)
+        return compress_file(final_path)
@@ -0,0 +1,372 @@
+import os
+import csv
+import time
+import sqlite3
+import argparse
+from datetime import datetime
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+CATALOG_DB = "schema_catalog.db"
+
+# CSV written by get_all_columns.py
+COLUMNS_CSV = "all_tables_all_columns.csv"
+
+SEARCH_LIMIT = 200
+
+# column_name/type are NOCASE so '=' and LIKE 'prefix%' can use their indexes.
+# 'id' is what columns_fts points at: an INTEGER PRIMARY KEY keeps its value
+# through VACUUM, which the implicit rowid of a composite-key table doesn't.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS columns (
+    id            INTEGER PRIMARY KEY,
+    data_source   TEXT NOT NULL,
+    table_name    TEXT NOT NULL,
+    column_name   TEXT NOT NULL COLLATE NOCASE,
+    type          TEXT COLLATE NOCASE,
+    null_ok       TEXT,
+    key           TEXT,
+    default_value TEXT,
+    extra         TEXT,
+    position      INTEGER,
+    updated_at    TEXT,
+    UNIQUE (data_source, table_name, column_name)
+);
+CREATE INDEX IF NOT EXISTS idx_columns_name ON columns(column_name);
+CREATE INDEX IF NOT EXISTS idx_columns_type ON columns(type);
+
+CREATE TABLE IF NOT EXISTS sources (
+    data_source TEXT PRIMARY KEY,
+    tables      INTEGER,
+    columns     INTEGER,
+    loaded_at   TEXT
+);
+"""
+
+# Keep columns_fts in step with columns
+TRIGGERS = {
+    "columns_ai": """
+CREATE TRIGGER IF NOT EXISTS columns_ai AFTER INSERT ON columns BEGIN
+    INSERT INTO columns_fts(rowid, column_name, table_name)
+    VALUES (new.id, new.column_name, new.table_name);
+END""",
+    "columns_ad": """
+CREATE TRIGGER IF NOT EXISTS columns_ad AFTER DELETE ON columns BEGIN
+    INSERT INTO columns_fts(columns_fts, rowid, column_name, table_name)
+    VALUES ('delete', old.id, old.column_name, old.table_name);
+END""",
+    "columns_au": """
+CREATE TRIGGER IF NOT EXISTS columns_au AFTER UPDATE OF column_name, table_name ON columns BEGIN
+    INSERT INTO columns_fts(columns_fts, rowid, column_name, table_name)
+    VALUES ('delete', old.id, old.column_name, old.table_name);
+    INSERT INTO columns_fts(rowid, column_name, table_name)
+    VALUES (new.id, new.column_name, new.table_name);
+END""",
+}
+
+# Trigram lets "url" find pageUrl / ref_url; unicode61 (whole words) is the
+# fallback for SQLite builds older than 3.34.
+FTS_TOKENIZERS = ["trigram", "unicode61"]
+
+UPSERT_SQL = """
+INSERT INTO columns (data_source, table_name, column_name, type, null_ok, key,
+                     default_value, extra, position, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (data_source, table_name, column_name) DO UPDATE SET
+    type = excluded.type,
+    null_ok = excluded.null_ok,
+    key = excluded.key,
+    default_value = excluded.default_value,
+    extra = excluded.extra,
+    position = excluded.position,
+    updated_at = excluded.updated_at
+WHERE columns.type IS NOT excluded.type
+   OR columns.null_ok IS NOT excluded.null_ok
+   OR columns.key IS NOT excluded.key
+   OR columns.default_value IS NOT excluded.default_value
+   OR columns.extra IS NOT excluded.extra
+   OR columns.position IS NOT excluded.position
+"""
+
+RESULT_COLUMNS = "c.data_source, c.table_name, c.column_name, c.type, c.null_ok, c.key"
+
+###############################################################################
+# CATALOG
+###############################################################################
+
+def connect(path=CATALOG_DB):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    existing = [row[1] for row in conn.execute("PRAGMA table_info(columns)")]
+    if existing and "id" not in existing:
+        # catalog built before columns had an 'id'; it only holds crawl/CSV
+        # results, so start it over rather than migrate
+        print(f"{path} predates the 'id' column; recreating it, reload with 'load'.")
+        conn.executescript(
+            "DROP TABLE IF EXISTS columns_fts; DROP TABLE columns; DROP TABLE IF EXISTS sources;"
+        )
+    has_fts = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'columns_fts'"
+    ).fetchone()
+    if not has_fts:
+        for tokenizer in FTS_TOKENIZERS:
+            try:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE columns_fts USING fts5("
+                    "column_name, table_name, content='columns', content_rowid='id', "
+                    f"tokenize='{tokenizer}')"
+                )
+                break
+            except sqlite3.OperationalError:
+                continue
+    conn.executescript(SCHEMA)
+    for sql in TRIGGERS.values():
+        conn.execute(sql)
+    return conn
+
+
+def fts_tokenizer(conn):
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'columns_fts'").fetchone()
+    return "trigram" if row and "trigram" in row[0] else "unicode61"
+
+
+def _upsert_table(conn, data_source, table_name, columns):
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    existing = {
+        name.lower() for (name,) in conn.execute(
+            "SELECT column_name FROM columns WHERE data_source = ? AND table_name = ?",
+            (data_source, table_name),
+        )
+    }
+    written = conn.executemany(UPSERT_SQL, [
+        (data_source, table_name, name, col_type, is_null, key_info, default_val, extra, pos, now)
+        for pos, (name, col_type, is_null, key_info, default_val, extra) in enumerate(columns)
+        if name
+    ]).rowcount
+    gone = existing - {c[0].lower() for c in columns if c[0]}
+    conn.executemany(
+        "DELETE FROM columns WHERE data_source = ? AND table_name = ? AND column_name = ?",
+        [(data_source, table_name, name) for name in gone],
+    )
+    return written, len(gone)
+
+
+def upsert_table(conn, data_source, table_name, columns):
+    """
+    Make the catalog's columns for one table match 'columns', a list of
+    (column_name, type, null, key, default, extra) in DESCRIBE order, in its
+    own transaction. Unchanged rows aren't rewritten; columns that
+    disappeared are removed. Returns (written, removed).
+    """
+    with conn:
+        return _upsert_table(conn, data_source, table_name, columns)
+
+
+def _prune_tables(conn, data_source, keep_tables):
+    keep = set(keep_tables)
+    stale = [
+        t for (t,) in conn.execute(
+            "SELECT DISTINCT table_name FROM columns WHERE data_source = ?", (data_source,)
+        ) if t not in keep
+    ]
+    removed = 0
+    for table_name in stale:
+        removed += conn.execute(
+            "DELETE FROM columns WHERE data_source = ? AND table_name = ?",
+            (data_source, table_name),
+        ).rowcount
+    update_source_stats(conn, data_source)
+    return removed
+
+
+def prune_tables(conn, data_source, keep_tables):
+    """
+    Remove tables of data_source that are no longer listed (e.g. after SHOW TABLES),
+    then refresh its row in 'sources'. Returns the number of columns removed.
+    """
+    with conn:
+        return _prune_tables(conn, data_source, keep_tables)
+
+
+def update_source_stats(conn, data_source):
+    n_tables, n_columns = conn.execute(
+        "SELECT COUNT(DISTINCT table_name), COUNT(*) FROM columns WHERE data_source = ?",
+        (data_source,),
+    ).fetchone()
+    conn.execute(
+        "INSERT OR REPLACE INTO sources (data_source, tables, columns, loaded_at) VALUES (?, ?, ?, ?)",
+        (data_source, n_tables, n_columns, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+    )
+
+
+def load_csv(conn, csv_path=COLUMNS_CSV):
+    """
+    Upsert a whole all_tables_all_columns.csv. Each data source in the file
+    replaces what the catalog had for it; other data sources are untouched.
+    """
+    tables = {}
+    with open(csv_path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            key = (row["data_source"], row["table_name"])
+            tables.setdefault(key, []).append((
+                row["column_name"], row["type"], row["null"], row["key"],
+                row["default"], row["extra"],
+            ))
+    written = removed = 0
+    by_source = {}
+    # One transaction for the whole file. Row-by-row FTS updates cost ~3x a
+    # single rebuild at this size, so the triggers are off until the end.
+    conn.execute("BEGIN")
+    with conn:
+        for name in TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        for (ds, table_name), columns in tables.items():
+            w, r = _upsert_table(conn, ds, table_name, columns)
+            written += w
+            removed += r
+            by_source.setdefault(ds, []).append(table_name)
+        for ds, table_names in by_source.items():
+            removed += _prune_tables(conn, ds, table_names)
+        conn.execute("INSERT INTO columns_fts(columns_fts) VALUES ('rebuild')")
+        for sql in TRIGGERS.values():
+            conn.execute(sql)
+    return written, removed
+
+###############################################################################
+# QUERIES
+###############################################################################
+
+def _filters(data_source, type_prefix):
+    clauses, params = [], []
+    if data_source:
+        clauses.append("c.data_source = ?")
+        params.append(data_source)
+    if type_prefix:
+        clauses.append("c.type LIKE ?")
+        params.append(type_prefix + "%")
+    return clauses, params
+
+
+def search(conn, term, data_source=None, type_prefix=None, exact=False, limit=SEARCH_LIMIT):
+    """
+    Columns whose name is 'term' (exact, case-insensitive) or contains it.
+    """
+    clauses, params = _filters(data_source, type_prefix)
+    if exact:
+        sql = f"SELECT {RESULT_COLUMNS} FROM columns AS c WHERE c.column_name = ?"
+        params = [term] + params
+    elif len(term) >= 3 and fts_tokenizer(conn) == "trigram":
+        sql = (
+            f"SELECT {RESULT_COLUMNS} FROM columns_fts AS f "
+            "JOIN columns AS c ON c.id = f.rowid "
+            "WHERE columns_fts MATCH ?"
+        )
+        # only the column_name field, term quoted as one phrase
+        params = ['column_name : "' + term.replace('"', '""') + '"'] + params
+    else:
+        sql = f"SELECT {RESULT_COLUMNS} FROM columns AS c WHERE c.column_name LIKE ?"
+        params = ["%" + term + "%"] + params
+    for clause in clauses:
+        sql += " AND " + clause
+    sql += " ORDER BY c.data_source, c.table_name, c.position LIMIT ?"
+    return conn.execute(sql, params + [limit]).fetchall()
+
+
+def tables_with_columns(conn, names, data_source=None, limit=SEARCH_LIMIT):
+    """
+    (data_source, table_name) of tables that have every column in 'names'.
+    """
+    clauses, params = _filters(data_source, None)
+    sql = (
+        "SELECT c.data_source, c.table_name FROM columns AS c "
+        f"WHERE c.column_name IN ({','.join('?' for _ in names)})"
+    )
+    for clause in clauses:
+        sql += " AND " + clause
+    sql += (
+        " GROUP BY c.data_source, c.table_name"
+        " HAVING COUNT(DISTINCT c.column_name) = ?"
+        " ORDER BY c.data_source, c.table_name LIMIT ?"
+    )
+    return conn.execute(sql, list(names) + params + [len(set(n.lower() for n in names)), limit]).fetchall()
+
+
+def table_columns(conn, data_source, table_name):
+    return conn.execute(
+        f"SELECT {RESULT_COLUMNS} FROM columns AS c "
+        "WHERE c.data_source = ? AND c.table_name = ? ORDER BY c.position",
+        (data_source, table_name),
+    ).fetchall()
+
+###############################################################################
+# MAIN SCRIPT
+###############################################################################
+
+def print_rows(rows, header):
+    widths = [max(len(str(x)) for x in col) for col in zip(header, *rows)] if rows else [len(h) for h in header]
+    print("  ".join(h.ljust(w) for h, w in zip(header, widths)))
+    for row in rows:
+        print("  ".join(str(x if x is not None else "").ljust(w) for x, w in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the local schema catalog.")
+    parser.add_argument("--db", default=CATALOG_DB)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("load", help=f"upsert a {COLUMNS_CSV} into the catalog")
+    p.add_argument("csv_path", nargs="?", default=COLUMNS_CSV)
+
+    p = sub.add_parser("search", help="columns whose name contains TERM")
+    p.add_argument("term")
+    p.add_argument("--exact", action="store_true", help="whole name, case-insensitive")
+    p.add_argument("--source", help="only this data source")
+    p.add_argument("--type", help="type prefix, e.g. varchar or json")
+    p.add_argument("--limit", type=int, default=SEARCH_LIMIT)
+
+    p = sub.add_parser("tables", help="tables that have all of the given columns")
+    p.add_argument("columns", help="comma-separated, e.g. pageUrl,action_tracker_id")
+    p.add_argument("--source")
+
+    p = sub.add_parser("describe", help="columns of one table")
+    p.add_argument("data_source")
+    p.add_argument("table_name")
+
+    sub.add_parser("stats", help="tables/columns per data source")
+    args = parser.parse_args()
+
+    if args.command != "load" and not os.path.exists(args.db):
+        print(f"No catalog at {args.db}; run 'python schema_catalog.py load' or get_all_columns.py first.")
+        return
+
+    conn = connect(args.db)
+    start = time.perf_counter()
+    if args.command == "load":
+        written, removed = load_csv(conn, args.csv_path)
+        print(f"Loaded {args.csv_path}: {written} columns written, {removed} removed.")
+    elif args.command == "search":
+        rows = search(conn, args.term, args.source, args.type, args.exact, args.limit)
+        print_rows(rows, ["data_source", "table", "column", "type", "null", "key"])
+        print(f"{len(rows)} columns")
+    elif args.command == "tables":
+        names = [c.strip() for c in args.columns.split(",") if c.strip()]
+        rows = tables_with_columns(conn, names, args.source)
+        print_rows(rows, ["data_source", "table"])
+        print(f"{len(rows)} tables")
+    elif args.command == "describe":
+        rows = table_columns(conn, args.data_source, args.table_name)
+        print_rows(rows, ["data_source", "table", "column", "type", "null", "key"])
+    else:
+        rows = conn.execute(
+            "SELECT data_source, tables, columns, loaded_at FROM sources ORDER BY data_source"
+        ).fetchall()
+        print_rows(rows, ["data_source", "tables", "columns", "loaded_at"])
+    print(f"({(time.perf_counter() - start) * 1000:.1f} ms)")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
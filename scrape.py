@@ -1,19 +1,23 @@
 import os
-import time
 import csv
 import re
 import json
+import argparse
+from functools import lru_cache
+from itertools import chain
 from collections import defaultdict, Counter
-from urllib.parse import urlparse
-
-from selenium import webdriver
-from selenium.common.exceptions import ElementClickInterceptedException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.webdriver.support.ui import Select, WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from datetime import datetime, timedelta
+
+from csv_store import append_csv_rows, enforce_retention, open_text, read_csv_rows, resolve
+from discovery import ConvergenceMonitor
+from oid_profile import OID_PROFILE_CSV, OidProfile, profile_csv, write_profiles
+from query_session import QueryRunnerSession, make_driver
+from sketches import DomainSketch, load_sketches, merge_sketch_maps, save_sketches
+from tracing import Tracer
+from tracker_planner import build_plan, split_batch_csv
+from url_split import split_urls
+from wide_csv import WideCsvReader
+from work_queue import POLL_INTERVAL, WORK_QUEUE_DB, Heartbeat, WorkQueue
 
 ###############################################################################
 # CONFIG
@@ -36,35 +40,43 @@ ACTION_TRACKER_IDS = [
     38225
 ]
 
+# If set, trackers are looked up per advertiser instead of using
+# ACTION_TRACKER_IDS: only ACTIVE SALE/PIXEL trackers are kept, trackers with
+# no rows in the window are skipped, and the rest are queried largest first,
+# small ones packed together (see tracker_planner.py / tracker_plan.csv).
+ADVERTISER_IDS = []
+
+# oid_type / oid_length / prefix / sub_method are derived locally from the raw
+# oid, method and has_jsver columns (see oid_profile.py) and written per row
+# to oid_columns_{atid}.csv next to each query_{atid}.csv
 SQL_TEMPLATE = """
 SELECT
     campaign_dim_id,
     campaign_id,
     action_tracker_id,
     oid,
-    LENGTH(oid) AS oid_length,
-    CASE
-        WHEN (method like '%XHR%' OR method like '%BEACON%' OR (method like '%PIXEL%' AND json like '%jsver%')) THEN 'utt'
-        WHEN method like '%API%' THEN 'conv_api'
-        WHEN method like '%BATCH%' THEN 'ftp'
-        ELSE 'other'
-    END AS sub_method,
     method,
-    CASE
-        WHEN oid REGEXP '^[0-9]+$' THEN 'Numeric'
-        WHEN oid REGEXP '^[A-Za-z]+$' THEN 'Alphabetic'
-        WHEN oid REGEXP '^[A-Za-z0-9]+$' THEN 'Alphanumeric'
-        ELSE 'Special Characters Present'
-    END AS oid_type,
-    LEFT(oid, 3) AS prefix,
+    (json LIKE '%jsver%') AS has_jsver,
     JSON_EXTRACT_STRING(json, 'pageUrl') AS pageUrl
 FROM conversion_fact
-WHERE event_datetime >= NOW() - INTERVAL 2 DAY
+WHERE {TIME_FILTER}
   AND network_id = 1
-  AND action_tracker_id = {ACTION_TRACKER_ID}
+  AND action_tracker_id IN ({ACTION_TRACKER_IDS})
   AND oid != '' AND oid IS NOT NULL
 """
 
+DEFAULT_TIME_FILTER = "event_datetime >= NOW() - INTERVAL 2 DAY"
+
+# Discovery mode: stop reading a tracker's rows once no new pattern has shown
+# up for discovery.DISCOVERY_WINDOW rows. The 2-day range is fetched in
+# DISCOVERY_SHARD_HOURS slices (newest first) and later slices are skipped
+# once patterns have converged. The slices are anchored on the server's
+# clock, read once per batch with DB_NOW_SQL.
+DISCOVERY_MODE = False
+LOOKBACK_HOURS = 48
+DISCOVERY_SHARD_HOURS = 12
+DB_NOW_SQL = "SELECT NOW() AS db_now"
+
 OPERATOR_QUERY_URL = "https://operator.impactradius.net/secure/operator/report/queryrunner/res/index.html"
 
 DOWNLOAD_DIR = os.path.abspath("downloaded_csv")
@@ -74,53 +86,37 @@ CHROME_PROFILE_DIR = os.path.abspath("my_chrome_profile")
 
 FINAL_CSV_PATH = "final_url_variations.csv"
 
-###############################################################################
-# SELENIUM SETUP
-###############################################################################
+# "exact" keeps every distinct path per domain.
+# "sketch" keeps a fixed-size summary per domain instead (see sketches.py):
+# distinct-path estimate, top segments per position, top paths/shapes.
+AGGREGATION_MODE = "exact"
+
+# Sketch mode: an alpha/hyphen segment stays literal only if it is one of the
+# domain's top segments and was seen at least this many times.
+SKETCH_LITERAL_MIN_COUNT = 3
 
-chrome_options = Options()
-chrome_options.add_argument(f"--user-data-dir={CHROME_PROFILE_DIR}")
-chrome_options.add_experimental_option("prefs", {
-    "download.default_directory": DOWNLOAD_DIR,
-    "download.prompt_for_download": False,
-    "download.directory_upgrade": True,
-    "plugins.always_open_pdf_externally": True
-})
+# Sketch mode: state is saved here; with SKETCH_MERGE_PREVIOUS the previous
+# run's sketches are merged in first (e.g. to accumulate several days).
+SKETCH_STATE_PATH = "domain_sketches.json"
+SKETCH_MERGE_PREVIOUS = False
 
-driver = webdriver.Chrome(options=chrome_options)
+tracer = Tracer("scrape")
 
 ###############################################################################
 # HELPER FUNCTIONS
 ###############################################################################
 
-def find_submit_button():
-    """
-    Try multiple locators for the 'Submit' or 'Run Query' button.
-    """
-    locators = [
-        (By.XPATH, "//input[@value='Submit']"),
-        (By.XPATH, "//button[contains(text(),'Submit')]"),
-        (By.ID, "submitBtn"),
-        (By.XPATH, "//input[@value='Run Query']"),
-        (By.XPATH, "//button[contains(text(),'Run Query')]"),
-    ]
-    for how, what in locators:
-        try:
-            return driver.find_element(how, what)
-        except:
-            pass
-    return None
-
 def is_alpha_hyphen(segment):
     """
     Return True if the segment is purely letters or hyphens (e.g. 'account-blocked').
     """
     return bool(re.match(r'^[A-Za-z-]+$', segment))
 
-def build_path_pattern_with_suffix(path, freq_counter):
+def build_path_pattern_with_suffix(path, freq_counter, min_count=1):
     """
     Produce a regex-like pattern for 'path', appending '(?:/.*)?' to allow anything after.
-    If a segment is alpha/hyphen and repeated or it contains a KEYWORD substring, keep it literal.
+    If a segment is alpha/hyphen and seen at least min_count times in freq_counter
+    or it contains a KEYWORD substring, keep it literal.
     Otherwise, classify as [0-9]+, [A-Za-z]+, [A-Za-z0-9]+, or [^/]+.
     """
     segs = path.strip("/").split("/") if path.strip("/") else []
@@ -133,8 +129,8 @@ def build_path_pattern_with_suffix(path, freq_counter):
 
         literal_flag = False
         if is_alpha_hyphen(seg):
-            # If freq>=1 or any KEYWORD is a substring
-            if freq_counter[seg] >= 1:
+            # If freq>=min_count or any KEYWORD is a substring
+            if freq_counter[seg] >= min_count:
                 literal_flag = True
             else:
                 for kw in KEYWORDS:
@@ -159,198 +155,531 @@ def build_path_pattern_with_suffix(path, freq_counter):
     core = "/".join(pattern_parts)
     return f"/{core}(?:/.*)?"
 
+class _SeenOnce:
+    def __getitem__(self, seg):
+        return 1
+
+@lru_cache(maxsize=4096)
+def row_pattern(path):
+    """
+    The pattern exact mode will generate for 'path'. Every segment of a path is
+    in its own domain's freq_counter, so this doesn't depend on any other row
+    and can be computed while streaming.
+    """
+    return build_path_pattern_with_suffix(path, _SeenOnce())
+
+@lru_cache(maxsize=4096)
+def path_shape(path):
+    """
+    Pattern for 'path' with only KEYWORD segments kept literal.
+    Used as the sketch-mode fallback so rare paths still get covered.
+    """
+    return build_path_pattern_with_suffix(path, Counter())
+
+def new_domain_entry():
+    entry = {"tracker_ids": set(), "campaign_ids": set()}
+    if AGGREGATION_MODE == "sketch":
+        entry["sketch"] = DomainSketch()
+    else:
+        entry["paths"] = set()
+    return entry
+
+def exact_path_patterns(paths):
+    """
+    Patterns from every distinct path, with segment frequencies counted exactly.
+    """
+    # Build freq_counter for path segments
+    freq_counter = Counter()
+    for p in paths:
+        segs = p.strip("/").split("/") if p.strip("/") else []
+        for seg in segs:
+            freq_counter[seg] += 1
+
+    # Transform each path -> pattern
+    path_patterns = []
+    for p in sorted(paths):
+        pat = build_path_pattern_with_suffix(p, freq_counter)
+        path_patterns.append(pat)
+    return path_patterns
+
+def sketch_path_patterns(sketch):
+    """
+    Patterns from a DomainSketch: its top paths (literal segments decided by the
+    segment sketches) plus its top path shapes.
+    """
+    counts = sketch.counts_view()
+    path_patterns = [
+        build_path_pattern_with_suffix(p, counts, SKETCH_LITERAL_MIN_COUNT)
+        for p in sketch.candidate_paths()
+    ]
+    path_patterns += sketch.candidate_shapes()
+    return path_patterns
+
+def save_domain_sketches(domain_data):
+    """
+    Write the sketch-mode state to SKETCH_STATE_PATH (merging the previous run's if asked).
+    """
+    sketches = {dom: info["sketch"] for dom, info in domain_data.items() if "sketch" in info}
+    if SKETCH_MERGE_PREVIOUS and os.path.exists(SKETCH_STATE_PATH):
+        sketches = merge_sketch_maps(load_sketches(SKETCH_STATE_PATH), sketches)
+    save_sketches(SKETCH_STATE_PATH, sketches)
+    est = sum(sk.distinct_paths() for sk in sketches.values())
+    print(f"Saved sketches for {len(sketches)} domains (~{est} distinct paths) to {SKETCH_STATE_PATH}.")
+
+def build_results(domain_data):
+    """
+    Turn domain -> {tracker_ids, campaign_ids, paths or sketch} into sorted
+    (domain, tracker_ids, campaign_ids, patterns_json) rows for FINAL_CSV_PATH.
+    """
+    results = []
+    for dom, info in domain_data.items():
+        if "sketch" in info:
+            path_patterns = sketch_path_patterns(info["sketch"])
+        elif info["paths"]:
+            path_patterns = exact_path_patterns(info["paths"])
+        else:
+            continue
+
+        t_list = sorted(info["tracker_ids"])
+        t_str = ",".join(str(x) for x in t_list)
+
+        c_list = sorted(info["campaign_ids"])
+        c_str = ",".join(c_list)
+
+        unique_patterns = sorted(set(path_patterns))
+        patterns_json = json.dumps(unique_patterns)
+
+        # We'll only store domain, trackers, campaigns, patterns
+        results.append((dom, t_str, c_str, patterns_json))
+
+    results.sort(key=lambda x: x[0])
+    return results
+
+def parse_tracker_csv(csv_path, atid, domain_data, monitor=None):
+    """
+    Add every row's domain/campaign/path from a query_{atid}.csv (plain or
+    compressed) into domain_data.
+    With a ConvergenceMonitor, stops reading as soon as it has converged.
+    An export without the pageUrl/campaign_id columns marks the tracker
+    problematic instead of stopping the run.
+    Returns the number of rows read.
+    """
+    row_count = 0
+    with tracer.span("parse", tracker=atid) as sp:
+        sp.add(bytes=os.path.getsize(csv_path))
+        # only the two columns we need, no dict per row
+        batches = iter(WideCsvReader(csv_path, ["pageUrl", "campaign_id"]))
+        try:
+            # the header is checked when the first batch is read
+            first = next(batches, None)
+        except KeyError as e:
+            print(f"  {os.path.basename(csv_path)}: {e}. Skipping {atid}.")
+            if atid not in problematic_ids:
+                problematic_ids.append(atid)
+            sp.add(missing_columns=1)
+            return 0
+        for batch in chain([first] if first is not None else [], batches):
+            # domain/path of the whole batch at once, same as urlparse (see url_split.py)
+            domains, paths = split_urls(batch["pageUrl"])
+            for domain, path_str, c_id in zip(domains, paths, batch["campaign_id"]):
+                row_count += 1
+                if domain is None:
+                    continue  # blank pageUrl
+
+                path_str = path_str or "/"
+                c_id = c_id.strip()
+
+                info = domain_data[domain]
+                info["tracker_ids"].add(atid)
+                info["campaign_ids"].add(c_id)
+                if AGGREGATION_MODE == "sketch":
+                    info["sketch"].add_path(path_str, path_shape(path_str))
+                else:
+                    info["paths"].add(path_str)
+
+                if monitor is not None:
+                    shape = path_shape(path_str) if AGGREGATION_MODE == "sketch" else row_pattern(path_str)
+                    monitor.observe(domain, shape)
+                    if monitor.converged:
+                        sp.add(early_stop=1)
+                        break
+            if monitor is not None and monitor.converged:
+                break
+        sp.add(rows=row_count)
+    return row_count
+
+def fetch_db_now(session, label):
+    """
+    The server's NOW() (what DEFAULT_TIME_FILTER is relative to) as a
+    datetime, or None if the query failed.
+    """
+    path = session.run_query(DB_NOW_SQL, DOWNLOAD_DIR, f"db_now_{label}.csv", wait_seconds=5, tracker=label)
+    if not path:
+        return None
+    rows = read_csv_rows(path)
+    os.remove(path)
+    val = (rows[0].get("db_now") or "").strip() if rows else ""
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M:%S.%f"):
+        try:
+            return datetime.strptime(val, fmt)
+        except ValueError:
+            pass
+    print(f"  Unexpected NOW() value {val!r}.")
+    return None
+
+def discovery_time_filters(now):
+    """
+    LOOKBACK_HOURS split into DISCOVERY_SHARD_HOURS windows, newest first.
+    The shards run a query apart, so every window is a literal, half-open
+    [start, end) range from one 'now' (the server's, see fetch_db_now()):
+    NOW() in each query would shift the windows and return the rows at the
+    edges twice. The newest window has no upper end, like DEFAULT_TIME_FILTER.
+    """
+    now = now.replace(microsecond=0)
+    filters = []
+    for start in range(0, LOOKBACK_HOURS, DISCOVERY_SHARD_HOURS):
+        end = min(start + DISCOVERY_SHARD_HOURS, LOOKBACK_HOURS)
+        lower = (now - timedelta(hours=end)).strftime("%Y-%m-%d %H:%M:%S")
+        time_filter = f"event_datetime >= '{lower}'"
+        if start > 0:
+            upper = (now - timedelta(hours=start)).strftime("%Y-%m-%d %H:%M:%S")
+            time_filter += f" AND event_datetime < '{upper}'"
+        filters.append(time_filter)
+    return filters
+
+def batch_label(batch, batch_no):
+    """
+    A single tracker keeps its own query_{atid}.csv; several small trackers
+    share one query_batch_N.csv that is split afterwards.
+    """
+    return batch[0] if len(batch) == 1 else f"batch_{batch_no}"
+
+def plan_run(session):
+    """
+    The run's batches of trackers (largest first) and their estimated row counts.
+    """
+    if ADVERTISER_IDS:
+        print("\nPlanning trackers for advertisers:", ADVERTISER_IDS)
+        return build_plan(session, ADVERTISER_IDS, DOWNLOAD_DIR, MAX_RECORDS)
+    return [[atid] for atid in ACTION_TRACKER_IDS], {}
+
+def process_batch(session, batch, label, domain_data, oid_profiles, est_rows=None):
+    """
+    Query one batch of trackers and add its rows to domain_data/oid_profiles.
+    Returns False if a query failed.
+    """
+    print(f"\n--- Processing action_tracker_id = {', '.join(str(a) for a in batch)}"
+          + (f" (~{est_rows} rows)" if est_rows else "") + " ---")
+    # early stop only makes sense when the file is one tracker's rows
+    monitor = ConvergenceMonitor() if DISCOVERY_MODE and len(batch) == 1 else None
+    renamed_path = os.path.join(DOWNLOAD_DIR, f"query_{label}.csv")
+    derived_path = os.path.join(DOWNLOAD_DIR, f"oid_columns_{label}.csv")
+
+    # one query normally; newest-first time shards in discovery mode, all
+    # computed here from one server NOW() so they tile the lookback without
+    # overlapping
+    if DISCOVERY_MODE:
+        db_now = fetch_db_now(session, label)
+        if db_now is None:
+            print(f"  Could not read the server time. Skipping {label}.")
+            return False
+        shards = discovery_time_filters(db_now)
+    else:
+        shards = [DEFAULT_TIME_FILTER]
+    for shard_no, time_filter in enumerate(shards):
+        sql_query = SQL_TEMPLATE.format(
+            ACTION_TRACKER_IDS=",".join(str(atid) for atid in batch),
+            TIME_FILTER=time_filter,
+        ).strip()
+        shard_name = f"query_{label}.csv" if shard_no == 0 else f"query_{label}_shard{shard_no}.csv"
+        shard_derived = os.path.join(DOWNLOAD_DIR, "oid_columns_" + shard_name[len("query_"):])
+
+        # data source/maxRecords if needed, SQL, submit, CSV download
+        csv_path = session.run_query(
+            sql_query, DOWNLOAD_DIR, shard_name, wait_seconds=20, tracker=label
+        )
+        if not csv_path:
+            print(f"  Query failed. Skipping {label}.")
+            return False
+        print(f"  Saved {csv_path}")
+
+        # once discovery has converged, rows past that point aren't profiled
+        # either, so the profile only covers the rows parse_tracker_csv read
+        limit = None
+        if len(batch) == 1:
+            row_count = parse_tracker_csv(csv_path, label, domain_data, monitor)
+            print(f"  Parsed {row_count} rows from {shard_name}")
+            if monitor is not None and monitor.converged:
+                limit = row_count
+        with tracer.span("profile_oids", tracker=label) as sp:
+            profiled = profile_csv(csv_path, oid_profiles, tracker=label, limit=limit,
+                                   derived_path=shard_derived)
+            sp.add(rows=profiled)
+        if profiled >= MAX_RECORDS:
+            # Query Runner stops at maxRecords, so this export is probably missing
+            # rows (or whole trackers, in a packed batch). A converged discovery
+            # shard only counts the rows it needed, which weren't cut off.
+            print(f"  WARNING: {shard_name} reached MAX_RECORDS ({MAX_RECORDS} rows), "
+                  "results may be truncated.")
+            problematic_ids.extend(atid for atid in batch if atid not in problematic_ids)
+        if shard_no > 0:
+            # keep one query_{atid}.csv per tracker for post_process
+            append_csv_rows(csv_path, renamed_path)
+            if os.path.exists(resolve(shard_derived)):
+                append_csv_rows(resolve(shard_derived), derived_path)
+
+        if monitor is not None:
+            print(f"  Discovery: {monitor.report()}")
+            if monitor.converged:
+                print(f"  Patterns converged, not fetching further shards for {label}.")
+                break
+
+    batch_path = resolve(renamed_path)
+    if len(batch) > 1 and os.path.exists(batch_path):
+        for atid, tracker_path in split_batch_csv(batch_path, batch, DOWNLOAD_DIR).items():
+            row_count = parse_tracker_csv(tracker_path, atid, domain_data)
+            print(f"  Parsed {row_count} rows for {atid}")
+        os.remove(batch_path)
+        derived_batch = resolve(derived_path)
+        if os.path.exists(derived_batch):
+            split_batch_csv(derived_batch, batch, DOWNLOAD_DIR, prefix="oid_columns_")
+            os.remove(derived_batch)
+    return True
+
+def write_outputs(domain_data, oid_profiles):
+    """
+    Build the patterns and write FINAL_CSV_PATH and the OID profiles.
+    """
+    with tracer.span("build_patterns") as sp:
+        results = build_results(domain_data)
+        sp.add(rows=sum(len(info.get("paths", ())) for info in domain_data.values()))
+    if AGGREGATION_MODE == "sketch":
+        save_domain_sketches(domain_data)
+
+    # Write final CSV
+    with tracer.span("write_output", domains=len(results)), \
+            open(FINAL_CSV_PATH, "w", newline="", encoding="utf-8") as out_f:
+        writer = csv.writer(out_f)
+        writer.writerow(["domain", "action_tracker_ids", "campaign_ids", "patterns"])
+        for row_data in results:
+            writer.writerow(row_data)
+
+    print(f"\nWrote {len(results)} domain entries to {FINAL_CSV_PATH}.")
+
+    write_profiles(oid_profiles)
+    print(f"Wrote OID profiles for {len(oid_profiles)} trackers to {OID_PROFILE_CSV}.")
+    print("Problematic IDs:", problematic_ids)
+
+###############################################################################
+# MULTI-NODE (see work_queue.py)
+###############################################################################
+# Each worker claims batches from the shared queue and publishes one partial
+# per batch: the batch's domain entries (trackers, campaigns and distinct
+# paths, or sketches) and OID profiles, before any pattern is built. Patterns
+# depend on all of a domain's paths, so they're only built after merging,
+# which makes an exact-mode merge identical to a single-node run.
+
+def save_partial(path, domain_data, oid_profiles, flagged=()):
+    """
+    Write a batch's domain_data/oid_profiles to 'path' (.json.gz), atomically.
+    'flagged' are the batch's trackers to report as problematic (truncated).
+    """
+    domains = {}
+    for dom, info in domain_data.items():
+        entry = {"tracker_ids": sorted(info["tracker_ids"]), "campaign_ids": sorted(info["campaign_ids"])}
+        if "sketch" in info:
+            entry["sketch"] = info["sketch"].to_dict()
+        else:
+            entry["paths"] = sorted(info["paths"])
+        domains[dom] = entry
+    state = {
+        "aggregation_mode": AGGREGATION_MODE,
+        "domains": domains,
+        "oid_profiles": {tid: prof.to_dict() for tid, prof in oid_profiles.items()},
+        "flagged": list(flagged),
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # keep .gz last so open_text() compresses; the rename makes it visible whole
+    tmp = f"{path[:-3]}.{os.getpid()}.tmp.gz"
+    with open_text(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+    return path
+
+def load_partial(path, domain_data, oid_profiles):
+    """
+    Merge a partial written by save_partial() into domain_data/oid_profiles.
+    Raises ValueError if it was written in another AGGREGATION_MODE.
+    """
+    with open_text(path) as f:
+        state = json.load(f)
+    mode = state.get("aggregation_mode")
+    if mode != AGGREGATION_MODE:
+        raise ValueError(f"{path} was written with AGGREGATION_MODE = {mode!r}, "
+                         f"this run uses {AGGREGATION_MODE!r}")
+    for dom, entry in state["domains"].items():
+        info = domain_data[dom]
+        info["tracker_ids"].update(entry["tracker_ids"])
+        info["campaign_ids"].update(entry["campaign_ids"])
+        if "sketch" in entry:
+            info["sketch"].merge(DomainSketch.from_dict(entry["sketch"]))
+        else:
+            info["paths"].update(entry["paths"])
+    for tid, d in state["oid_profiles"].items():
+        prof = OidProfile.from_dict(d)
+        if tid in oid_profiles:
+            oid_profiles[tid].merge(prof)
+        else:
+            oid_profiles[tid] = prof
+    problematic_ids.extend(atid for atid in state.get("flagged", []) if atid not in problematic_ids)
+
+def merge_partials(queue):
+    """
+    Combine every finished batch's partial into FINAL_CSV_PATH.
+    """
+    domain_data = defaultdict(new_domain_entry)
+    oid_profiles = {}
+    partials = queue.partials()
+    with tracer.span("merge_partials") as sp:
+        for path in partials:
+            load_partial(path, domain_data, oid_profiles)
+        sp.add(files=len(partials))
+    print(f"\nMerged {len(partials)} partial results from {queue.partials_dir}.")
+    problematic_ids.extend(queue.failed_trackers())
+    write_outputs(domain_data, oid_profiles)
+
+def run_worker(session, queue):
+    """
+    Claim and process batches until the queue is finished; the last worker
+    to finish merges the partials.
+    """
+    if not queue.is_seeded():
+        batches, volumes = plan_run(session)
+        tasks = [
+            (str(batch_label(batch, batch_no)), batch, sum(volumes.get(atid, 0) for atid in batch) or None)
+            for batch_no, batch in enumerate(batches, 1)
+        ]
+        if queue.seed(tasks, aggregation_mode=AGGREGATION_MODE):
+            print(f"Seeded {queue.path} with {len(tasks)} batches.")
+        else:
+            print("Queue was seeded by another worker, using its plan.")
+    # partials of one queue are merged together, so they must all be built alike
+    mode = queue.get_meta("aggregation_mode")
+    if mode is not None and mode != AGGREGATION_MODE:
+        print(f"ERROR: {queue.path} was seeded with AGGREGATION_MODE = {mode!r}, "
+              f"this worker uses {AGGREGATION_MODE!r}.")
+        return
+
+    waiting = False
+    while True:
+        task = queue.claim()
+        if task is None:
+            if queue.finished():
+                break
+            if not waiting:
+                print(f"\nNothing to claim, waiting for other workers' leases ({queue.counts()}).")
+                waiting = True
+            tracer.sleep(POLL_INTERVAL, reason="queue_wait")
+            continue
+        waiting = False
+
+        batch = task["trackers"]
+        label = batch[0] if len(batch) == 1 else task["task_id"]
+        print(f"\nClaimed {task['task_id']} (attempt {task['attempts']}) as {queue.worker_id}.")
+        # a fresh aggregate per batch, so a retried batch never counts twice
+        domain_data = defaultdict(new_domain_entry)
+        oid_profiles = {}
+        del problematic_ids[:]
+        with Heartbeat(queue, task["task_id"]) as hb:
+            ok = process_batch(session, batch, label, domain_data, oid_profiles, task["est_rows"])
+        if hb.lost:
+            # another worker has the batch now; its result is the one that counts
+            print(f"  Dropping the result for {task['task_id']}, its lease was lost.")
+            continue
+        if not ok:
+            queue.fail(task["task_id"])
+            continue
+        # one file per worker, so a late run can't overwrite the published one
+        partial = os.path.join(queue.partials_dir, f"{task['task_id']}.{queue.worker_id}.json.gz")
+        # trackers process_batch flagged travel with the partial to the merge
+        partial = save_partial(partial, domain_data, oid_profiles, flagged=problematic_ids)
+        if not queue.complete(task["task_id"], partial):
+            print(f"  Dropping the result for {task['task_id']}, its lease was taken over.")
+            os.remove(partial)
+
+    print(f"\nQueue finished: {queue.counts()}.")
+    if queue.claim_merge():
+        merge_partials(queue)
+
 ###############################################################################
 # MAIN SCRIPT
 ###############################################################################
 
 def main():
+    parser = argparse.ArgumentParser(description="Build final_url_variations.csv from Query Runner exports.")
+    parser.add_argument("--worker", action="store_true",
+                        help="claim batches from a shared work queue instead of running them all")
+    parser.add_argument("--queue", default=WORK_QUEUE_DB, help="work queue file (on shared storage)")
+    parser.add_argument("--worker-id", help="defaults to hostname-pid")
+    parser.add_argument("--merge", action="store_true",
+                        help="only merge the workers' partials into final_url_variations.csv")
+    args = parser.parse_args()
+
+    if args.merge:
+        # no browser needed, only the partials
+        queue = WorkQueue(args.queue, args.worker_id)
+        try:
+            if not queue.finished():
+                print(f"Queue not finished yet ({queue.counts()}), merging what's done.")
+            merge_partials(queue)
+        finally:
+            queue.close()
+            tracer.close()
+        return
+
+    driver = make_driver(DOWNLOAD_DIR, CHROME_PROFILE_DIR)
     try:
         print("\nNavigating to Operator Query Runner page...")
         driver.get(OPERATOR_QUERY_URL)
 
         input("\nIf needed, log in with Google. Press Enter once loaded...")
 
-        # Attempt to set data source once
-        try:
-            wait = WebDriverWait(driver, 10)
-            ds_elem = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "select#dataSourceSelect")))
-            Select(ds_elem).select_by_value("r_ds_singlestore")
-            print("Data source changed to r_ds_singlestore initially.")
-        except Exception as e:
-            print(f"Couldn't change data source initially: {e}")
-
-        # We'll store domain -> {tracker_ids,set, campaign_ids:set, paths:set}
-        domain_data = defaultdict(lambda: {"tracker_ids": set(), "campaign_ids": set(), "paths": set()})
-
-        for atid in ACTION_TRACKER_IDS:
-            print(f"\n--- Processing action_tracker_id = {atid} ---")
-            driver.refresh()
-            time.sleep(2)
-
-            # re-select data source
-            try:
-                ds_elem = driver.find_element(By.CSS_SELECTOR, "select#dataSourceSelect")
-                Select(ds_elem).select_by_value("r_ds_singlestore")
-                print("  Data source re-selected to r_ds_singlestore.")
-            except Exception as e:
-                print(f"  Could not set data source: {e}")
-
-            # set maxRecords
-            try:
-                wait = WebDriverWait(driver, 10)
-                max_records_input = wait.until(
-                    EC.presence_of_element_located((By.ID, "maxRecords"))
-                )
-            except:
-                # fallback
-                try:
-                    max_records_input = driver.find_element(By.XPATH, "//input[@name='maxRecords']")
-                except:
-                    max_records_input = None
-
-            if max_records_input:
-                max_records_input.clear()
-                max_records_input.send_keys(str(MAX_RECORDS))
-                print(f"  Set Max Records to {MAX_RECORDS}.")
-            else:
-                print("  #maxRecords field not found. Skipping this ID.")
-                problematic_ids.append(atid)
-                continue
-
-            # Build SQL
-            sql_query = SQL_TEMPLATE.format(ACTION_TRACKER_ID=atid).strip()
-
-            # Clear + type in CodeMirror
-            code_mirror_area = None
-            try:
-                code_mirror_area = driver.find_element(By.CSS_SELECTOR, ".CodeMirror-code")
-            except:
-                code_mirror_area = driver.find_element(By.CSS_SELECTOR, ".CodeMirror")
-
-            code_mirror_area.click()
-            time.sleep(0.5)
-            actions = ActionChains(driver)
-            actions.key_down(Keys.CONTROL).send_keys("a").key_up(Keys.CONTROL)
-            actions.send_keys(Keys.DELETE)
-            actions.send_keys(sql_query)
-            actions.perform()
-            print("  Entered SQL command.")
-
-            # submit
-            submit_btn = find_submit_button()
-            if not submit_btn:
-                print("  ERROR: No submit button. Skipping.")
-                problematic_ids.append(atid)
-                continue
-
-            time.sleep(1)
-            try:
-                submit_btn.click()
-            except ElementClickInterceptedException:
-                print("  Submit intercepted, waiting then retrying.")
-                time.sleep(5)
-                try:
-                    submit_btn.click()
-                except ElementClickInterceptedException:
-                    print("  Still failing, skipping ID.")
-                    problematic_ids.append(atid)
-                    continue
-
-            print("  Wait 20s for query to run...")
-            time.sleep(20)
-
-            # CSV radio
-            try:
-                csv_radio = driver.find_element(By.ID, "view_csv")
-                csv_radio.click()
-                print("  Selected 'CSV' radio.")
-            except:
-                print("  Could not select CSV radio... skipping")
-                problematic_ids.append(atid)
-                continue
-
-            time.sleep(3)
-            csv_path = os.path.join(DOWNLOAD_DIR, "query.csv")
-            renamed_path = os.path.join(DOWNLOAD_DIR, f"query_{atid}.csv")
-
-            time.sleep(2)
-            if os.path.exists(csv_path):
-                os.rename(csv_path, renamed_path)
-                print(f"  Renamed {csv_path} -> {renamed_path}")
-
-                # parse
-                row_count = 0
-                with open(renamed_path, "r", encoding="utf-8") as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        row_count += 1
-                        full_url = row.get("pageUrl", "").strip()
-                        if not full_url:
-                            continue
-
-                        parsed = urlparse(full_url)
-                        domain = parsed.netloc.lower().split(':')[0]
-                        path_str = parsed.path or "/"
-                        c_id = row.get("campaign_id", "").strip()
-
-                        domain_data[domain]["tracker_ids"].add(atid)
-                        domain_data[domain]["campaign_ids"].add(c_id)
-                        domain_data[domain]["paths"].add(path_str)
-
-                print(f"  Parsed {row_count} rows from query_{atid}.csv")
-            else:
-                print(f"  {csv_path} not found. Skipping {atid}.")
-                problematic_ids.append(atid)
-                continue
-
-        # finalize
-        results = []
-        for dom, info in domain_data.items():
-            if not info["paths"]:
-                continue
-
-            t_list = sorted(info["tracker_ids"])
-            t_str = ",".join(str(x) for x in t_list)
-
-            c_list = sorted(info["campaign_ids"])
-            c_str = ",".join(c_list)
+        # old exports are compressed, but still capped by age/total size
+        enforce_retention(DOWNLOAD_DIR)
 
-            # Build freq_counter for path segments
-            freq_counter = Counter()
-            for p in info["paths"]:
-                segs = p.strip("/").split("/") if p.strip("/") else []
-                for seg in segs:
-                    freq_counter[seg] += 1
+        # One page for the whole run; it's only reloaded after an error
+        session = QueryRunnerSession(driver, "r_ds_singlestore", MAX_RECORDS, tracer=tracer)
 
-            # Transform each path -> pattern
-            path_patterns = []
-            for p in sorted(info["paths"]):
-                pat = build_path_pattern_with_suffix(p, freq_counter)
-                path_patterns.append(pat)
+        if args.worker:
+            queue = WorkQueue(args.queue, args.worker_id)
+            run_worker(session, queue)
+            queue.close()
+            tracer.summary()
+            return
 
-            unique_patterns = sorted(set(path_patterns))
-            patterns_json = json.dumps(unique_patterns)
+        # We'll store domain -> {tracker_ids:set, campaign_ids:set, paths:set}
+        # (or a fixed-size 'sketch' instead of 'paths' in sketch mode)
+        domain_data = defaultdict(new_domain_entry)
+        # action_tracker_id -> OidProfile (type mix, length histogram, top prefixes)
+        oid_profiles = {}
 
-            # We'll only store domain, trackers, campaigns, patterns
-            results.append((dom, t_str, c_str, patterns_json))
+        batches, volumes = plan_run(session)
+        for batch_no, batch in enumerate(batches, 1):
+            est = sum(volumes.get(atid, 0) for atid in batch)
+            if not process_batch(session, batch, batch_label(batch, batch_no),
+                                 domain_data, oid_profiles, est):
+                problematic_ids.extend(batch)
 
-        results.sort(key=lambda x: x[0])
-
-        # Write final CSV
-        with open(FINAL_CSV_PATH, "w", newline="", encoding="utf-8") as out_f:
-            writer = csv.writer(out_f)
-            writer.writerow(["domain", "action_tracker_ids", "campaign_ids", "patterns"])
-            for row_data in results:
-                writer.writerow(row_data)
-
-        print(f"\nWrote {len(results)} domain entries to {FINAL_CSV_PATH}.")
-        print("Problematic IDs:", problematic_ids)
+        # finalize
+        write_outputs(domain_data, oid_profiles)
+        tracer.summary()
 
         input("\nAll queries done. Press Enter to close...")
 
     finally:
         print("Closing browser.")
         driver.quit()
+        tracer.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
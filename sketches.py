@@ -0,0 +1,355 @@
+import json
+import math
+import heapq
+import base64
+import hashlib
+from array import array
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+# HyperLogLog: 2**HLL_P registers (one byte each) -> ~1.6% standard error at p=12
+HLL_P = 12
+
+# Count-Min: DEPTH rows of WIDTH counters
+CMS_WIDTH = 1024
+CMS_DEPTH = 4
+
+# Space-Saving sizes (entries kept per domain)
+TOP_SEGMENTS_PER_POSITION = 50
+TOP_PATHS = 500
+TOP_SHAPES = 200
+
+# Segment positions tracked separately; deeper segments share the last slot
+MAX_POSITIONS = 8
+
+###############################################################################
+# HASHING
+###############################################################################
+
+def hash64(value, seed=0):
+    """
+    Stable 64-bit hash (Python's hash() is salted per process, which would
+    make saved/merged sketches meaningless).
+    """
+    data = value.encode("utf-8") if isinstance(value, str) else bytes(value)
+    digest = hashlib.blake2b(data, digest_size=8, salt=seed.to_bytes(8, "little")).digest()
+    return int.from_bytes(digest, "little")
+
+###############################################################################
+# HYPERLOGLOG
+###############################################################################
+
+class HyperLogLog:
+    """
+    Distinct-count estimate in 2**p bytes.
+    """
+    def __init__(self, p=HLL_P, registers=None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = registers if registers is not None else bytearray(self.m)
+
+    def add(self, value):
+        h = hash64(value)
+        idx = h & (self.m - 1)
+        w = h >> self.p
+        # rank = position of the first 1-bit in the remaining 64-p bits
+        rank = (64 - self.p) - w.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def count(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        total = 0.0
+        zeros = 0
+        for r in self.registers:
+            total += 2.0 ** -r
+            if r == 0:
+                zeros += 1
+        estimate = alpha * m * m / total
+        if estimate <= 2.5 * m and zeros:
+            # small-range correction (linear counting)
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError("Can't merge HyperLogLogs with different precision")
+        regs = self.registers
+        for i, r in enumerate(other.registers):
+            if r > regs[i]:
+                regs[i] = r
+        return self
+
+    def to_dict(self):
+        return {"p": self.p, "registers": base64.b64encode(bytes(self.registers)).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["p"], bytearray(base64.b64decode(d["registers"])))
+
+###############################################################################
+# COUNT-MIN
+###############################################################################
+
+class CountMinSketch:
+    """
+    Frequency estimates that never undercount, in WIDTH*DEPTH counters.
+    """
+    def __init__(self, width=CMS_WIDTH, depth=CMS_DEPTH, table=None):
+        self.width = width
+        self.depth = depth
+        self.table = table if table is not None else array("q", bytes(8 * width * depth))
+        self.total = 0
+
+    def _cells(self, value):
+        h = hash64(value)
+        h1 = h & 0xFFFFFFFF
+        h2 = (h >> 32) | 1
+        for row in range(self.depth):
+            yield row * self.width + (h1 + row * h2) % self.width
+
+    def add(self, value, count=1):
+        table = self.table
+        for cell in self._cells(value):
+            table[cell] += count
+        self.total += count
+
+    def __getitem__(self, value):
+        table = self.table
+        return min(table[cell] for cell in self._cells(value))
+
+    def merge(self, other):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Can't merge Count-Min sketches of different shape")
+        table = self.table
+        for i, c in enumerate(other.table):
+            table[i] += c
+        self.total += other.total
+        return self
+
+    def to_dict(self):
+        return {
+            "width": self.width,
+            "depth": self.depth,
+            "total": self.total,
+            "table": base64.b64encode(self.table.tobytes()).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        table = array("q")
+        table.frombytes(base64.b64decode(d["table"]))
+        sketch = cls(d["width"], d["depth"], table)
+        sketch.total = d["total"]
+        return sketch
+
+###############################################################################
+# SPACE-SAVING
+###############################################################################
+
+class SpaceSaving:
+    """
+    Top-K heavy hitters in K entries. counts[item] over-estimates by at most
+    errors[item]. A lazy min-heap keeps eviction O(log K).
+    """
+    def __init__(self, k):
+        self.k = k
+        self.counts = {}
+        self.errors = {}
+        self._heap = []
+
+    def _push(self, item):
+        heapq.heappush(self._heap, (self.counts[item], item))
+        if len(self._heap) > 4 * self.k:
+            self._heap = [(c, i) for i, c in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        while True:
+            c, item = heapq.heappop(self._heap)
+            if self.counts.get(item) == c:
+                return item, c
+
+    def add(self, item, count=1):
+        counts = self.counts
+        if item in counts:
+            counts[item] += count
+        elif len(counts) < self.k:
+            counts[item] = count
+            self.errors[item] = 0
+        else:
+            victim, min_count = self._pop_min()
+            del counts[victim]
+            del self.errors[victim]
+            counts[item] = min_count + count
+            self.errors[item] = min_count
+        self._push(item)
+
+    def __contains__(self, item):
+        return item in self.counts
+
+    def __getitem__(self, item):
+        return self.counts.get(item, 0)
+
+    def min_count(self):
+        if len(self.counts) < self.k:
+            return 0
+        return min(self.counts.values())
+
+    def top(self, n=None):
+        items = sorted(self.counts.items(), key=lambda kv: (-kv[1], kv[0]))
+        return items if n is None else items[:n]
+
+    def merge(self, other):
+        """
+        Standard Space-Saving merge: an item missing from one side is assumed
+        to have that side's minimum count, then the top K are kept.
+        """
+        min_self, min_other = self.min_count(), other.min_count()
+        merged, errors = {}, {}
+        for item in set(self.counts) | set(other.counts):
+            merged[item] = self.counts.get(item, min_self) + other.counts.get(item, min_other)
+            errors[item] = self.errors.get(item, min_self) + other.errors.get(item, min_other)
+        keep = sorted(merged.items(), key=lambda kv: (-kv[1], kv[0]))[:self.k]
+        self.counts = dict(keep)
+        self.errors = {item: errors[item] for item in self.counts}
+        self._heap = [(c, i) for i, c in self.counts.items()]
+        heapq.heapify(self._heap)
+        return self
+
+    def to_dict(self):
+        return {"k": self.k, "items": [[i, c, self.errors[i]] for i, c in self.counts.items()]}
+
+    @classmethod
+    def from_dict(cls, d):
+        ss = cls(d["k"])
+        for item, count, err in d["items"]:
+            ss.counts[item] = count
+            ss.errors[item] = err
+        ss._heap = [(c, i) for i, c in ss.counts.items()]
+        heapq.heapify(ss._heap)
+        return ss
+
+###############################################################################
+# PER-DOMAIN SKETCH
+###############################################################################
+
+class SegmentCounts:
+    """
+    Counter-like view for build_path_pattern_with_suffix(): a segment's count is
+    its Count-Min estimate if it is among the top segments at any position,
+    otherwise 0.
+    """
+    def __init__(self, sketch):
+        self.sketch = sketch
+
+    def __getitem__(self, seg):
+        if any(seg in ss for ss in self.sketch.top_segments):
+            return self.sketch.segments[seg]
+        return 0
+
+
+class DomainSketch:
+    """
+    Fixed-size summary of one domain's paths:
+      - paths_hll: distinct path estimate
+      - segments: Count-Min of segment occurrences
+      - top_segments[i]: Space-Saving top segments at position i
+      - top_paths / top_shapes: the most common paths and path shapes,
+        used as the candidates that patterns are generated from
+    """
+    def __init__(self):
+        self.rows = 0
+        self.paths_hll = HyperLogLog()
+        self.segments = CountMinSketch()
+        self.top_segments = [SpaceSaving(TOP_SEGMENTS_PER_POSITION) for _ in range(MAX_POSITIONS)]
+        self.top_paths = SpaceSaving(TOP_PATHS)
+        self.top_shapes = SpaceSaving(TOP_SHAPES)
+
+    def add_path(self, path, shape=None):
+        self.rows += 1
+        self.paths_hll.add(path)
+        self.top_paths.add(path)
+        if shape is not None:
+            self.top_shapes.add(shape)
+        stripped = path.strip("/")
+        if not stripped:
+            return
+        for pos, seg in enumerate(stripped.split("/")):
+            self.segments.add(seg)
+            self.top_segments[min(pos, MAX_POSITIONS - 1)].add(seg)
+
+    def distinct_paths(self):
+        return self.paths_hll.count()
+
+    def candidate_paths(self):
+        return [p for p, _ in self.top_paths.top()]
+
+    def candidate_shapes(self):
+        return [s for s, _ in self.top_shapes.top()]
+
+    def counts_view(self):
+        return SegmentCounts(self)
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.paths_hll.merge(other.paths_hll)
+        self.segments.merge(other.segments)
+        for mine, theirs in zip(self.top_segments, other.top_segments):
+            mine.merge(theirs)
+        self.top_paths.merge(other.top_paths)
+        self.top_shapes.merge(other.top_shapes)
+        return self
+
+    def to_dict(self):
+        return {
+            "rows": self.rows,
+            "paths_hll": self.paths_hll.to_dict(),
+            "segments": self.segments.to_dict(),
+            "top_segments": [ss.to_dict() for ss in self.top_segments],
+            "top_paths": self.top_paths.to_dict(),
+            "top_shapes": self.top_shapes.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        sketch = cls()
+        sketch.rows = d["rows"]
+        sketch.paths_hll = HyperLogLog.from_dict(d["paths_hll"])
+        sketch.segments = CountMinSketch.from_dict(d["segments"])
+        sketch.top_segments = [SpaceSaving.from_dict(x) for x in d["top_segments"]]
+        sketch.top_paths = SpaceSaving.from_dict(d["top_paths"])
+        sketch.top_shapes = SpaceSaving.from_dict(d["top_shapes"])
+        return sketch
+
+###############################################################################
+# SAVE / LOAD
+###############################################################################
+
+def save_sketches(path, sketches):
+    """
+    Write {domain: DomainSketch} to a JSON file.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({dom: sk.to_dict() for dom, sk in sketches.items()}, f)
+
+
+def load_sketches(path):
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    return {dom: DomainSketch.from_dict(d) for dom, d in raw.items()}
+
+
+def merge_sketch_maps(into, other):
+    """
+    Merge {domain: DomainSketch} 'other' into 'into' (in place) and return it.
+    """
+    for dom, sk in other.items():
+        if dom in into:
+            into[dom].merge(sk)
+        else:
+            into[dom] = sk
+    return into
@@ -0,0 +1,109 @@
+import time
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.common.action_chains import ActionChains
+
+###############################################################################
+# CODEMIRROR JS
+###############################################################################
+
+# Set the whole editor value in one call through the CodeMirror 5 API and
+# hand back what the editor now holds, so we can check it round-tripped.
+# Returns null when the page has no CodeMirror instance we can reach.
+SET_SQL_JS = """
+var el = document.querySelector('.CodeMirror');
+if (!el || !el.CodeMirror) { return null; }
+var cm = el.CodeMirror;
+cm.setValue(arguments[0]);
+cm.focus();
+cm.setCursor(cm.lineCount(), 0);
+if (typeof cm.save === 'function') { cm.save(); }
+return cm.getValue();
+"""
+
+GET_SQL_JS = """
+var el = document.querySelector('.CodeMirror');
+if (!el || !el.CodeMirror) { return null; }
+return el.CodeMirror.getValue();
+"""
+
+###############################################################################
+# HELPER FUNCTIONS
+###############################################################################
+
+def _normalize(sql_text):
+    """
+    CodeMirror always stores '\\n' line endings and may drop trailing blanks.
+    """
+    return sql_text.replace("\r\n", "\n").rstrip()
+
+
+def get_editor_sql(driver):
+    """
+    Current contents of the CodeMirror editor, or None if it can't be read.
+    """
+    try:
+        return driver.execute_script(GET_SQL_JS)
+    except Exception:
+        return None
+
+
+def inject_sql(driver, sql_query):
+    """
+    Replace the editor contents via execute_script.
+    Returns True only if the editor now holds exactly sql_query.
+    """
+    try:
+        result = driver.execute_script(SET_SQL_JS, sql_query)
+    except Exception as e:
+        print(f"  JS SQL injection failed: {e}")
+        return False
+    if result is None:
+        return False
+    return _normalize(result) == _normalize(sql_query)
+
+
+def type_sql(driver, sql_query):
+    """
+    Old keystroke path: click the editor, select all, delete, and type the query.
+    Slow (one keystroke per character) and subject to auto-indent, so only used
+    as a fallback when the JS route is unavailable.
+    """
+    code_mirror_area = None
+    try:
+        code_mirror_area = driver.find_element(By.CSS_SELECTOR, ".CodeMirror-code")
+    except:
+        code_mirror_area = driver.find_element(By.CSS_SELECTOR, ".CodeMirror")
+
+    code_mirror_area.click()
+    time.sleep(0.5)
+    actions = ActionChains(driver)
+    actions.key_down(Keys.CONTROL).send_keys("a").key_up(Keys.CONTROL)
+    actions.send_keys(Keys.DELETE)
+    actions.send_keys(sql_query)
+    actions.perform()
+
+
+def enter_sql(driver, sql_query, tracer=None, tracker=None):
+    """
+    Put sql_query into the Query Runner editor.
+    Tries the CodeMirror JS API first and verifies the contents round-trip;
+    falls back to typing only when that fails. Returns "js" or "typed".
+    """
+    if tracer is not None:
+        with tracer.span("enter_sql", tracker=tracker, chars=len(sql_query)) as sp:
+            method = enter_sql(driver, sql_query)
+            sp.add(**{f"sql_{method}": 1})
+        return method
+
+    if inject_sql(driver, sql_query):
+        return "js"
+
+    print("  CodeMirror JS entry unavailable or mismatched, typing SQL instead.")
+    type_sql(driver, sql_query)
+
+    typed = get_editor_sql(driver)
+    if typed is not None and _normalize(typed) != _normalize(sql_query):
+        print("  WARNING: editor contents differ from the SQL that was typed.")
+    return "typed"
@@ -0,0 +1,218 @@
+import os
+import time
+import json
+import cProfile
+from collections import defaultdict
+from contextlib import contextmanager
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+# Where the JSONL traces and profiler dumps are written
+TRACE_DIR = "traces"
+
+# Optional profiler for the parsing stages: "", "cprofile" or "pyinstrument".
+# Can be overridden without editing code via the TRACE_PROFILER env variable.
+PROFILER = os.environ.get("TRACE_PROFILER", "")
+
+# Only stages listed here are wrapped by the profiler hook
+PROFILED_STAGES = {"parse", "build_patterns", "count_usage", "assemble"}
+
+###############################################################################
+# TRACER
+###############################################################################
+
+class Span:
+    """
+    One timed stage for one tracker (or None for run-wide work).
+    Counters such as rows, bytes and cache_hits are accumulated with add().
+    """
+    def __init__(self, stage, tracker=None, **attrs):
+        self.stage = stage
+        self.tracker = tracker
+        self.attrs = attrs
+        self.counters = defaultdict(int)
+        self.start = time.perf_counter()
+        self.elapsed = 0.0
+        self.error = None
+
+    def add(self, **counters):
+        for name, value in counters.items():
+            self.counters[name] += value
+
+
+class Tracer:
+    """
+    Lightweight span recorder shared by the scripts.
+    Every finished span is appended to traces/{run_name}_{timestamp}.jsonl,
+    and summary() prints a per-tracker/per-stage table at the end of a run.
+    """
+    def __init__(self, run_name, trace_dir=TRACE_DIR, enabled=True):
+        self.run_name = run_name
+        self.enabled = enabled
+        self.trace_dir = trace_dir
+        self.run_id = time.strftime("%Y%m%d_%H%M%S")
+        self.trace_path = os.path.join(trace_dir, f"{run_name}_{self.run_id}.jsonl")
+        self._out = None
+        self._run_start = time.perf_counter()
+        # (tracker, stage) -> {"calls", "seconds", counters...}
+        self._totals = defaultdict(lambda: defaultdict(float))
+
+    def _write(self, record):
+        if not self.enabled:
+            return
+        if self._out is None:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            self._out = open(self.trace_path, "a", encoding="utf-8")
+        self._out.write(json.dumps(record, default=str) + "\n")
+        self._out.flush()
+
+    def _record(self, span):
+        totals = self._totals[(span.tracker, span.stage)]
+        totals["calls"] += 1
+        totals["seconds"] += span.elapsed
+        for name, value in span.counters.items():
+            totals[name] += value
+
+        record = {
+            "ts": time.time(),
+            "run": self.run_name,
+            "stage": span.stage,
+            "tracker": span.tracker,
+            "seconds": round(span.elapsed, 6),
+        }
+        record.update(span.attrs)
+        record.update(span.counters)
+        if span.error:
+            record["error"] = span.error
+        self._write(record)
+
+    @contextmanager
+    def span(self, stage, tracker=None, **attrs):
+        """
+        Time a block of work:
+            with tracer.span("parse", tracker=atid) as sp:
+                sp.add(rows=1)
+        Exceptions are recorded on the span and re-raised.
+        """
+        sp = Span(stage, tracker, **attrs)
+        try:
+            if stage in PROFILED_STAGES and PROFILER:
+                with self.profile(stage, tracker):
+                    yield sp
+            else:
+                yield sp
+        except BaseException as e:
+            sp.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            sp.elapsed = time.perf_counter() - sp.start
+            self._record(sp)
+
+    def count(self, stage, tracker=None, **counters):
+        """
+        Record counters (e.g. cache_hits=1) without timing anything.
+        """
+        sp = Span(stage, tracker)
+        sp.add(**counters)
+        self._record(sp)
+
+    def sleep(self, seconds, tracker=None, reason=""):
+        """
+        time.sleep() that shows up in the trace as its own 'sleep' stage,
+        so fixed waits can be told apart from real work.
+        """
+        with self.span("sleep", tracker=tracker, reason=reason):
+            time.sleep(seconds)
+
+    @contextmanager
+    def profile(self, stage, tracker=None):
+        """
+        Wrap a block in cProfile or pyinstrument (if PROFILER is set).
+        Output goes to traces/{run}_{run_id}_{stage}[_{tracker}].prof / .html
+        """
+        if not PROFILER:
+            yield
+            return
+
+        os.makedirs(self.trace_dir, exist_ok=True)
+        suffix = f"_{tracker}" if tracker is not None else ""
+        base = os.path.join(self.trace_dir, f"{self.run_name}_{self.run_id}_{stage}{suffix}")
+
+        if PROFILER == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                print("  pyinstrument not installed, falling back to cProfile.")
+            else:
+                profiler = Profiler()
+                profiler.start()
+                try:
+                    yield
+                finally:
+                    profiler.stop()
+                    with open(base + ".html", "w", encoding="utf-8") as f:
+                        f.write(profiler.output_html())
+                return
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(base + ".prof")
+
+    def summary(self):
+        """
+        Print an end-of-run table (one line per tracker/stage) and
+        write it as a final 'summary' record in the JSONL trace.
+        """
+        total_run = time.perf_counter() - self._run_start
+        counter_names = sorted({
+            name for totals in self._totals.values() for name in totals
+            if name not in ("calls", "seconds")
+        })
+
+        header = ["tracker", "stage", "calls", "seconds", "%run"] + counter_names
+        lines = []
+        for (tracker, stage), totals in sorted(
+            self._totals.items(), key=lambda kv: (str(kv[0][0]), -kv[1]["seconds"])
+        ):
+            pct = (totals["seconds"] / total_run * 100) if total_run else 0.0
+            line = [
+                "-" if tracker is None else str(tracker),
+                stage,
+                str(int(totals["calls"])),
+                f"{totals['seconds']:.2f}",
+                f"{pct:.1f}",
+            ]
+            line += [str(int(totals.get(name, 0))) for name in counter_names]
+            lines.append(line)
+
+        widths = [len(h) for h in header]
+        for line in lines:
+            widths = [max(w, len(c)) for w, c in zip(widths, line)]
+
+        print(f"\n=== Trace summary: {self.run_name} ({total_run:.1f}s total) ===")
+        print("  ".join(h.ljust(w) for h, w in zip(header, widths)))
+        for line in lines:
+            print("  ".join(c.ljust(w) for c, w in zip(line, widths)))
+        if self.enabled:
+            print(f"Trace written to {self.trace_path}")
+
+        self._write({
+            "ts": time.time(),
+            "run": self.run_name,
+            "stage": "summary",
+            "seconds": round(total_run, 6),
+            "totals": [
+                {"tracker": t, "stage": s, **dict(v)} for (t, s), v in self._totals.items()
+            ],
+        })
+
+    def close(self):
+        if self._out is not None:
+            self._out.close()
+            self._out = None
@@ -0,0 +1,272 @@
+import os
+import csv
+from datetime import datetime
+
+from csv_store import default_codec, open_text, read_csv_rows, remove_variants, resolve, suffix_for
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+# Where ircm_actiontracker / ircm_campaign are queried
+METADATA_DATA_SOURCE = "r_ds_singlestore"
+
+# Where the conversion_fact volume estimate runs (same as the extraction)
+VOLUME_DATA_SOURCE = "r_ds_singlestore"
+
+# Only these tracker types/methods are worth extracting page URLs for
+WANTED_TRACKER_TYPES = {"SALE"}
+WANTED_METHODS = {"PIXEL"}
+
+# Same window/filters as scrape.SQL_TEMPLATE, so the estimate matches what we'd fetch
+VOLUME_TIME_FILTER = "event_datetime >= NOW() - INTERVAL 2 DAY"
+
+# Small trackers are packed together into one IN-list query of at most
+# BATCH_FILL * maxRecords estimated rows and BATCH_MAX_TRACKERS trackers;
+# anything bigger gets a query of its own. Volume keeps growing between the
+# COUNT(*) and the extraction, so batches are planned well below the cap
+# where Query Runner would cut rows off.
+BATCH_FILL = 0.6
+BATCH_MAX_TRACKERS = 50
+
+# Trackers per grouped COUNT(*) query
+VOLUME_IN_LIST_SIZE = 500
+
+TRACKER_PLAN_CSV = "tracker_plan.csv"
+
+METADATA_SQL_TEMPLATE = """
+SELECT
+  C.iram_advertiser_id,
+  M.ircm_campaign_id,
+  C.name AS campaign_name,
+  M.id   AS tracker_id,
+  M.name AS tracker_name,
+  M.trackerType,
+  M.method,
+  M.state,
+  M.activation_date,
+  M.deactivation_date
+FROM ircm_actiontracker AS M
+LEFT JOIN ircm_campaign AS C
+  ON M.ircm_campaign_id = C.id
+WHERE C.iram_advertiser_id = {ADVERTISER_ID}
+ORDER BY M.ircm_campaign_id, M.id
+"""
+
+VOLUME_SQL_TEMPLATE = """
+SELECT
+  action_tracker_id,
+  COUNT(*) AS row_count
+FROM conversion_fact
+WHERE {TIME_FILTER}
+  AND network_id = 1
+  AND action_tracker_id IN ({ACTION_TRACKER_IDS})
+  AND oid != '' AND oid IS NOT NULL
+GROUP BY action_tracker_id
+"""
+
+# How NULL shows up depending on where the export came from
+NULL_VALUES = {"", "ʘ", "NULL", "null", "None"}
+
+###############################################################################
+# HELPER FUNCTIONS
+###############################################################################
+
+def _value(row, name):
+    val = (row.get(name) or "").strip()
+    return None if val in NULL_VALUES else val
+
+
+def _parse_date(val):
+    if val is None:
+        return None
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(val, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+def skip_reason(row, now=None):
+    """
+    Why a metadata row should not be extracted, or None if it should.
+    """
+    now = now or datetime.now()
+    if (_value(row, "state") or "").upper() != "ACTIVE":
+        return "inactive"
+    if (_value(row, "trackerType") or "").upper() not in WANTED_TRACKER_TYPES:
+        return "tracker_type"
+    if (_value(row, "method") or "").upper() not in WANTED_METHODS:
+        return "method"
+    activation = _parse_date(_value(row, "activation_date"))
+    if activation is None or activation > now:
+        return "not_activated"
+    deactivation = _parse_date(_value(row, "deactivation_date"))
+    if deactivation is not None and deactivation <= now:
+        return "deactivated"
+    return None
+
+
+def plan_batches(volumes, max_rows, max_trackers=BATCH_MAX_TRACKERS):
+    """
+    volumes: {tracker_id: estimated rows}. Trackers with 0 rows are dropped.
+    Largest first; a tracker at/over max_rows gets its own batch, the rest are
+    packed first-fit-decreasing. Returns [[tracker_id, ...], ...] largest first.
+    """
+    ordered = sorted(
+        ((tid, n) for tid, n in volumes.items() if n > 0),
+        key=lambda kv: (-kv[1], kv[0]),
+    )
+    batches = []  # [ [ids], est_rows ]
+    for tid, n in ordered:
+        if n >= max_rows:
+            batches.append([[tid], n])
+            continue
+        for batch in batches:
+            ids, total = batch
+            if total < max_rows and total + n <= max_rows and len(ids) < max_trackers:
+                ids.append(tid)
+                batch[1] += n
+                break
+        else:
+            batches.append([[tid], n])
+    return [ids for ids, _ in batches]
+
+###############################################################################
+# PLANNER
+###############################################################################
+
+def discover_trackers(session, advertiser_ids, download_dir):
+    """
+    One metadata query per advertiser. Returns ({tracker_id: metadata_row}, skipped)
+    where skipped maps reason -> count.
+    """
+    trackers = {}
+    skipped = {}
+    now = datetime.now()
+    for adv in advertiser_ids:
+        print(f"  Looking up trackers for advertiser {adv}...")
+        sql_query = METADATA_SQL_TEMPLATE.format(ADVERTISER_ID=int(adv)).strip()
+        path = session.run_query(
+            sql_query, download_dir, f"trackers_{adv}.csv",
+            data_source=METADATA_DATA_SOURCE, wait_seconds=10, tracker=f"adv_{adv}",
+        )
+        if not path:
+            print(f"  Could not read trackers for advertiser {adv}.")
+            continue
+        for row in read_csv_rows(path):
+            tid = _value(row, "tracker_id")
+            if not tid:
+                continue
+            reason = skip_reason(row, now)
+            if reason:
+                skipped[reason] = skipped.get(reason, 0) + 1
+                continue
+            trackers[int(tid)] = row
+    return trackers, skipped
+
+
+def estimate_volumes(session, tracker_ids, download_dir, max_rows):
+    """
+    Grouped COUNT(*) over conversion_fact (one query per VOLUME_IN_LIST_SIZE trackers).
+    Trackers with no rows come back as 0; unestimated ones as max_rows.
+    """
+    volumes = {tid: 0 for tid in tracker_ids}
+    ids = sorted(tracker_ids)
+    for i in range(0, len(ids), VOLUME_IN_LIST_SIZE):
+        chunk = ids[i:i + VOLUME_IN_LIST_SIZE]
+        sql_query = VOLUME_SQL_TEMPLATE.format(
+            TIME_FILTER=VOLUME_TIME_FILTER,
+            ACTION_TRACKER_IDS=",".join(str(t) for t in chunk),
+        ).strip()
+        path = session.run_query(
+            sql_query, download_dir, f"tracker_volume_{i // VOLUME_IN_LIST_SIZE}.csv",
+            data_source=VOLUME_DATA_SOURCE, wait_seconds=20, tracker="volume",
+        )
+        if not path:
+            # no estimate -> keep them, in one batch each, rather than drop them
+            print(f"  Volume query failed; scheduling {len(chunk)} trackers unestimated.")
+            for tid in chunk:
+                volumes[tid] = max_rows
+            continue
+        for row in read_csv_rows(path):
+            tid = _value(row, "action_tracker_id")
+            count = _value(row, "row_count")
+            if tid and count:
+                volumes[int(tid)] = int(float(count))
+    return volumes
+
+
+def write_plan(batches, volumes, trackers, path=TRACKER_PLAN_CSV):
+    with open(path, "w", newline="", encoding="utf-8") as out_f:
+        writer = csv.writer(out_f)
+        writer.writerow([
+            "batch", "action_tracker_id", "est_rows", "iram_advertiser_id",
+            "ircm_campaign_id", "tracker_name",
+        ])
+        for n, batch in enumerate(batches, 1):
+            for tid in batch:
+                meta = trackers.get(tid, {})
+                writer.writerow([
+                    n, tid, volumes.get(tid, ""), meta.get("iram_advertiser_id", ""),
+                    meta.get("ircm_campaign_id", ""), meta.get("tracker_name", ""),
+                ])
+
+
+def build_plan(session, advertiser_ids, download_dir, max_records):
+    """
+    Discover extractable trackers for the advertisers, estimate their volume and
+    return (batches, volumes): batches is [[tracker_id, ...], ...], largest first.
+    max_records is the Query Runner maxRecords the batches will run with.
+    """
+    trackers, skipped = discover_trackers(session, advertiser_ids, download_dir)
+    if skipped:
+        print("  Skipped trackers: " + ", ".join(f"{k}={v}" for k, v in sorted(skipped.items())))
+    if not trackers:
+        return [], {}
+
+    max_rows = int(max_records * BATCH_FILL)
+    volumes = estimate_volumes(session, list(trackers), download_dir, max_rows)
+    empty = sum(1 for n in volumes.values() if n == 0)
+    batches = plan_batches(volumes, max_rows)
+    write_plan(batches, volumes, trackers)
+
+    print(f"  {len(trackers)} trackers found, {empty} with no rows, "
+          f"{len(batches)} queries planned (see {TRACKER_PLAN_CSV}).")
+    return batches, volumes
+
+
+def split_batch_csv(batch_path, tracker_ids, download_dir, prefix="query_"):
+    """
+    Split a multi-tracker query CSV into {prefix}{atid}.csv files (by the
+    action_tracker_id column, compressed like the downloads). Returns
+    {atid: path}; trackers without rows get a header-only file so later steps
+    see them as empty, not missing.
+    """
+    suffix = suffix_for(default_codec())
+    paths = {}
+    for tid in tracker_ids:
+        logical = os.path.join(download_dir, f"{prefix}{tid}.csv")
+        paths[tid] = logical + suffix
+        remove_variants(logical, keep=paths[tid])
+    with open_text(resolve(batch_path)) as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return {}
+        tid_idx = header.index("action_tracker_id")
+        # batches are capped at maxRecords, so buffering them is cheap and
+        # keeps one compressor open at a time
+        rows_by_tid = {str(tid): [] for tid in tracker_ids}
+        for row in reader:
+            if len(row) > tid_idx:
+                bucket = rows_by_tid.get(row[tid_idx].strip())
+                if bucket is not None:
+                    bucket.append(row)
+    for tid, path in paths.items():
+        with open_text(path, "w") as out_f:
+            writer = csv.writer(out_f)
+            writer.writerow(header)
+            writer.writerows(rows_by_tid[str(tid)])
+    return paths
@@ -0,0 +1,251 @@
+import re
+import sys
+import glob
+import time
+import random
+import argparse
+from bisect import bisect_right
+from itertools import accumulate
+from urllib.parse import urlparse
+
+from wide_csv import BATCH_SIZE, iter_column_rows
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+# Differential check / benchmark input when no files are given
+DEFAULT_GLOB = "downloaded_csv/query_*.csv*"
+BENCH_ROWS = 200000
+
+# One match per line of "\n".join(urls) -> (host, path). urlsplit() only takes
+# a scheme if everything before the first ':' is a scheme character, starting
+# with a letter; the netloc is what follows '//' up to the first '/', '?' or
+# '#' (the host is the netloc up to its first ':'), and the path runs up to the
+# first '?' or '#'. The rest of the line is consumed so findall() moves
+# straight on to the next one.
+URL_RE = re.compile(
+    r"^(?:[A-Za-z][A-Za-z0-9+.-]*:)?(?://([^/?#:\n]*)[^/?#\n]*)?([^?#\n]*)[^\n]*",
+    re.MULTILINE,
+)
+
+# Characters urlparse treats specially; lines with any of them go through
+# urlparse itself. That's anything but printable ASCII (it strips whitespace
+# and control characters and checks non-ASCII hosts), '[' / ']' (IPv6
+# hosts, validated) and ';' (params, split off depending on the scheme).
+# As one negated class: '!'-':', '<'-'Z', '\\', '^'-'~' and the newline.
+SPECIAL_RE = re.compile(r"[^!-:<-Z\\^-~\n]")
+
+###############################################################################
+# SPLITTER
+###############################################################################
+# split_urls() gives the same (domain, path) per URL as
+#
+#   url = url.strip()
+#   parsed = urlparse(url)
+#   domain = parsed.netloc.lower().split(':')[0]
+#   path   = parsed.path
+#
+# but works on a whole batch at once: the batch is joined into one string,
+# one findall() pulls out every host and path, and the hosts are lowercased
+# in one go. No per-row Python code runs except for the rare lines
+# SPECIAL_RE flags and blank ones.
+
+def _slow_split(url):
+    url = url.strip()
+    if not url:
+        return None, None
+    parsed = urlparse(url)
+    return parsed.netloc.lower().split(":")[0], parsed.path
+
+
+def split_urls(urls):
+    """
+    (domains, paths) lists for a batch of URLs (e.g. a WideCsvReader column):
+    each host lowercased and without port (or anything after a ':' in the
+    netloc), each path without query, fragment or ;params.
+    Blank URLs give None for both.
+    """
+    if not urls:
+        return [], []
+    blob = "\n".join(urls)
+    matches = URL_RE.findall(blob)
+    if len(matches) != len(urls):
+        # a value with a newline in it; no line <-> row mapping
+        matches = [_slow_split(url) for url in urls]
+        return [h for h, _ in matches], [p for _, p in matches]
+    hosts, paths = zip(*matches)
+    hosts = "\n".join(hosts).lower().split("\n")
+    paths = list(paths)
+
+    redo = set()
+    special = SPECIAL_RE.search(blob)
+    if special:
+        starts = list(accumulate((len(url) + 1 for url in urls), initial=0))
+        for m in SPECIAL_RE.finditer(blob, special.start()):
+            redo.add(bisect_right(starts, m.start()) - 1)
+    if not blob or "\n\n" in blob or blob[0] == "\n" or blob[-1] == "\n":
+        redo.update(i for i, url in enumerate(urls) if not url)
+    for i in redo:
+        hosts[i], paths[i] = _slow_split(urls[i])
+    return hosts, paths
+
+###############################################################################
+# DIFFERENTIAL CHECK / BENCHMARK
+###############################################################################
+
+# Inputs that exercise every branch, on top of the real pageUrls
+EDGE_CASES = [
+    "https://Shop.COM/Checkout/Thanks?x=1#top",
+    "http://shop.com:8080",
+    "http://shop.com?q=/a/b",
+    "http://shop.com#frag/x",
+    "http://user:pw@Shop.com:443/a",
+    "HTTPS://SHOP.COM/A;jsessionid=1?x",
+    "https://shop.com/a;b/c;d/e",
+    "https://shop.com/a/b;c",
+    "https://shop.com;x/p",
+    "ftp://shop.com/a;type=i",
+    "android-app://com.shop/http/a;b",
+    "//shop.com/a",
+    "shop.com/checkout",
+    "/relative/path",
+    "mailto:someone@shop.com",
+    "1http://shop.com/a",
+    "http:shop.com/a",
+    "http:/shop.com/a",
+    "http:///a/b",
+    "https://",
+    "",
+    ":",
+    "https://[::1]:8080/a",
+    "https://xn--bcher-kva.example/a",
+    "https://bücher.example/Ä",
+    "https://shop.com/ä/ö?ü",
+    "https://shop.com/a\tb",
+    "\x01https://shop.com/a",
+    " https://shop.com/a",
+    "https://shop.com/a\u200b",
+    "https://shop.com/%2F?a",
+    "http://shop.com?",
+    "http://shop.com#",
+    "http://shop.com/?#",
+]
+
+
+# Random URLs built from these pieces, for the differential check
+FUZZ_PREFIXES = [
+    "http://", "https://", "HTTPS://", "ftp://", "//", "", "x:", "1:", "mailto:",
+    "http:/", "http:", " http://", "tel:",
+]
+FUZZ_ALPHABET = "aZ09:/?#;@[]. \t\n%-+\u00e4\u2100\x00"
+FUZZ_ROWS = 100000
+
+
+def load_urls(patterns, limit=None):
+    urls = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            try:
+                for (page_url,) in iter_column_rows(path, ["pageUrl"]):
+                    urls.append(page_url)
+                    if limit and len(urls) >= limit:
+                        return urls
+            except KeyError:
+                continue  # not a pageUrl export
+    return urls
+
+
+def fuzz_urls(n, seed=0):
+    rnd = random.Random(seed)
+    return [
+        rnd.choice(FUZZ_PREFIXES) + "".join(rnd.choice(FUZZ_ALPHABET) for _ in range(rnd.randint(0, 14)))
+        for _ in range(n)
+    ]
+
+
+def differential_check(urls, batch_size=BATCH_SIZE):
+    """
+    Compare split_urls() with urlparse row by row; returns the mismatches.
+    URLs urlparse rejects (ValueError) must make split_urls() raise too.
+    """
+    mismatches = []
+    valid = []
+    for url in urls:
+        try:
+            _slow_split(url)
+            valid.append(url)
+        except ValueError:
+            try:
+                split_urls([url])
+                mismatches.append((url, "ValueError", "no error"))
+            except ValueError:
+                pass
+    for i in range(0, len(valid), batch_size):
+        batch = valid[i:i + batch_size]
+        hosts, paths = split_urls(batch)
+        for url, host, path in zip(batch, hosts, paths):
+            expected = _slow_split(url)
+            if (host, path) != expected:
+                mismatches.append((url, expected, (host, path)))
+    return mismatches
+
+
+def bench(label, fn, urls, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(urls)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"  {label:<24} {best * 1e3:8.1f} ms  ({best / len(urls) * 1e9:6.0f} ns/URL)")
+    return best
+
+###############################################################################
+# MAIN SCRIPT
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check split_urls() against urlparse and benchmark both.")
+    parser.add_argument("paths", nargs="*", help=f"query CSVs with a pageUrl column (default {DEFAULT_GLOB})")
+    parser.add_argument("--rows", type=int, default=BENCH_ROWS, help="URLs to benchmark with")
+    parser.add_argument("--fuzz", type=int, default=FUZZ_ROWS, help="random URLs added to the check")
+    args = parser.parse_args()
+
+    urls = load_urls(args.paths or [DEFAULT_GLOB])
+    print(f"Loaded {len(urls)} pageUrls.")
+
+    checked = EDGE_CASES + urls + fuzz_urls(args.fuzz)
+    mismatches = differential_check(checked)
+    print(f"Differential check: {len(checked)} URLs, {len(mismatches)} mismatches.")
+    for url, expected, got in mismatches[:20]:
+        print(f"  {url!r}: urlparse {expected!r}, split_urls {got!r}")
+
+    if urls:
+        sample = (urls * (args.rows // len(urls) + 1))[:args.rows]
+        # shuffled, so urlsplit()'s small lru_cache doesn't see runs of one URL
+        random.shuffle(sample)
+
+        def per_row(batch):
+            # what scrape.parse_tracker_csv did for every row
+            out = []
+            for url in batch:
+                parsed = urlparse(url.strip())
+                out.append((parsed.netloc.lower().split(":")[0], parsed.path))
+            return out
+
+        def batched(batch):
+            for i in range(0, len(batch), BATCH_SIZE):
+                split_urls(batch[i:i + BATCH_SIZE])
+
+        print(f"Benchmark, {len(sample)} URLs in batches of {BATCH_SIZE} (best of 3):")
+        t_old = bench("urlparse per row", per_row, sample)
+        t_new = bench("split_urls", batched, sample)
+        print(f"  speedup {t_old / t_new:.1f}x")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
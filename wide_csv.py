@@ -0,0 +1,276 @@
+import csv
+import json
+import mmap
+import argparse
+from array import array
+
+from csv_store import codec_of, open_binary, resolve
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+# Rows per yielded batch; memory use is bounded by this, not by file size
+BATCH_SIZE = 10000
+
+# Stored for int columns when the cell is empty or not a number
+INT_NULL = -1
+
+###############################################################################
+# LAZY JSON
+###############################################################################
+
+class LazyJsonColumn:
+    """
+    Holds the raw JSON text of one column for a batch and only runs
+    json.loads() on the cells that are actually read (results are cached).
+    Bad or empty JSON comes back as None.
+    """
+    def __init__(self, raw_values):
+        self.raw = raw_values
+        self._parsed = {}
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, i):
+        if i in self._parsed:
+            return self._parsed[i]
+        text = self.raw[i]
+        try:
+            val = json.loads(text) if text else None
+        except ValueError:
+            val = None
+        self._parsed[i] = val
+        return val
+
+    def __iter__(self):
+        for i in range(len(self.raw)):
+            yield self[i]
+
+###############################################################################
+# READER
+###############################################################################
+
+class _PendingLines:
+    """
+    Input of _records()' csv.reader: the line(s) of the current quoted record.
+    If the reader wants more while a quote is still open (only at the end of
+    the file, or with quotes csv reads differently than the count suggests),
+    StopIteration makes it end the record there, like csv.DictReader does at
+    the end of a file; unlike a generator this keeps working afterwards.
+    """
+    def __init__(self):
+        self.lines = []
+
+    def append(self, line):
+        self.lines.append(line)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            raise StopIteration
+        return self.lines.pop()
+
+
+def _records(readline):
+    """
+    Yield each CSV record as a list of fields.
+    Lines without a quote are split directly on b',' (fields stay bytes);
+    quoted records (which may span several lines, e.g. JSON or user agents)
+    are fed to one long-lived csv.reader (fields come back as str).
+    A quote still open at the end of the file (truncated export) ends the
+    last record there, the way csv.DictReader reads it.
+    """
+    pending = _PendingLines()
+    quoted_reader = csv.reader(pending)
+    while True:
+        line = readline()
+        if not line:
+            return
+        if b'"' not in line:
+            yield line.rstrip(b"\r\n").split(b",")
+            continue
+        # keep pulling lines while a quoted field is still open
+        while line.count(b'"') % 2:
+            nxt = readline()
+            if not nxt:
+                break
+            line += nxt
+        pending.append(line.decode("utf-8", errors="replace"))
+        yield next(quoted_reader)
+
+
+def _new_column(col_type):
+    if col_type is int:
+        return array("q")
+    if col_type is float:
+        return array("d")
+    return []
+
+
+def _convert(raw, col_type):
+    if col_type is int:
+        try:
+            return int(raw)
+        except ValueError:
+            return INT_NULL
+    if col_type is float:
+        try:
+            return float(raw)
+        except ValueError:
+            return float("nan")
+    if isinstance(raw, bytes):
+        return raw.decode("utf-8", errors="replace")
+    return raw
+
+
+class WideCsvReader:
+    """
+    Streams a wide CSV export (e.g. the 110-column action export) in batches.
+
+        reader = WideCsvReader("query (18).csv",
+                               columns=["action_tracker_id", "ref_url", "payout_trace"],
+                               types={"action_tracker_id": int},
+                               json_fields=["payout_trace"])
+        for batch in reader:
+            batch["action_tracker_id"]  # array('q')
+            batch["ref_url"]            # list of str
+            batch["payout_trace"][0]    # dict, parsed on access
+
+    Plain files are memory-mapped; .zst/.gz files (or a plain path whose
+    compressed version is what's on disk, see csv_store.py) are streamed, and
+    any other binary file object with readline() can be passed as 'source'.
+    Only the requested columns are decoded, picked by header index.
+    """
+    def __init__(self, source, columns, types=None, json_fields=None, batch_size=BATCH_SIZE):
+        self.source = source
+        self.columns = list(columns)
+        self.types = dict(types or {})
+        self.json_fields = set(json_fields or [])
+        # JSON columns are always projected, even if not listed in 'columns'
+        self.columns += [c for c in sorted(self.json_fields) if c not in self.columns]
+        self.batch_size = batch_size
+        self.header = None
+        self.rows_read = 0
+
+    def _open(self):
+        """
+        Returns (readline, close) for the source.
+        """
+        if hasattr(self.source, "readline"):
+            return self.source.readline, lambda: None
+        path = resolve(self.source)
+        if codec_of(path):
+            f = open_binary(path)
+            return f.readline, f.close
+        f = open(path, "rb")
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file can't be mapped
+            return f.readline, f.close
+
+        def close():
+            mm.close()
+            f.close()
+        return mm.readline, close
+
+    def _empty_batch(self):
+        batch = {}
+        for name in self.columns:
+            batch[name] = _new_column(self.types.get(name))
+        return batch
+
+    def _finish(self, batch, n_rows):
+        for name in self.json_fields:
+            batch[name] = LazyJsonColumn(batch[name])
+        batch["_rows"] = n_rows
+        return batch
+
+    def __iter__(self):
+        readline, close = self._open()
+        try:
+            records = _records(readline)
+            header = next(records, None)
+            if header is None:
+                return
+            header = [_convert(h, None).strip() for h in header]
+            header[0] = header[0].lstrip("\ufeff")
+            self.header = header
+            positions = {name: i for i, name in enumerate(self.header)}
+            missing = [c for c in self.columns if c not in positions]
+            if missing:
+                raise KeyError(f"Columns not in header: {missing}")
+
+            # (output column, input index, type) for the projection
+            plan = [(name, positions[name], self.types.get(name)) for name in self.columns]
+
+            batch = self._empty_batch()
+            n_rows = 0
+            for fields in records:
+                if len(fields) == 1 and not fields[0].strip():
+                    continue  # blank line
+                n_fields = len(fields)
+                for name, idx, col_type in plan:
+                    raw = fields[idx] if idx < n_fields else ""
+                    batch[name].append(_convert(raw, col_type))
+                n_rows += 1
+                self.rows_read += 1
+                if n_rows >= self.batch_size:
+                    yield self._finish(batch, n_rows)
+                    batch = self._empty_batch()
+                    n_rows = 0
+            if n_rows:
+                yield self._finish(batch, n_rows)
+        finally:
+            close()
+
+
+def iter_column_rows(source, columns, types=None, batch_size=BATCH_SIZE):
+    """
+    Convenience wrapper: yield one tuple per row with just the requested columns.
+    """
+    for batch in WideCsvReader(source, columns, types=types, batch_size=batch_size):
+        yield from zip(*(batch[c] for c in columns))
+
+###############################################################################
+# MAIN SCRIPT
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Column summary of a wide CSV export.")
+    parser.add_argument("path")
+    parser.add_argument("--columns", required=True, help="comma-separated column names")
+    parser.add_argument("--json", default="", help="comma-separated JSON columns to parse")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    columns = [c.strip() for c in args.columns.split(",") if c.strip()]
+    json_fields = [c.strip() for c in args.json.split(",") if c.strip()]
+    reader = WideCsvReader(args.path, columns, json_fields=json_fields, batch_size=args.batch_size)
+
+    non_empty = {c: 0 for c in columns}
+    json_keys = {c: {} for c in json_fields}
+    for batch in reader:
+        for c in columns:
+            if c in json_keys:
+                for obj in batch[c]:
+                    if isinstance(obj, dict):
+                        non_empty[c] += 1
+                        for k in obj:
+                            json_keys[c][k] = json_keys[c].get(k, 0) + 1
+            else:
+                non_empty[c] += sum(1 for v in batch[c] if v)
+
+    print(f"{reader.rows_read} rows, {len(reader.header or [])} columns in header.")
+    for c in columns:
+        print(f"  {c}: {non_empty[c]} non-empty")
+        for k, n in sorted(json_keys.get(c, {}).items(), key=lambda kv: -kv[1])[:10]:
+            print(f"      {k}: {n}")
+
+
+if __name__ == "__main__":
+    main()
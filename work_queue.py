@@ -0,0 +1,320 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+
+###############################################################################
+# CONFIG
+###############################################################################
+
+# Put this on storage every worker host can reach (NFS/SMB share). The
+# partial results go to a "partials" directory next to it.
+WORK_QUEUE_DB = os.environ.get("WORK_QUEUE_DB", "work_queue.db")
+
+# A claimed batch goes back to the queue if its worker hasn't renewed the
+# lease for this long (crashed, lost the share, machine went to sleep).
+# Leases compare wall-clock times from different hosts, so keep this well
+# above any clock skew between them.
+LEASE_SECONDS = 600
+HEARTBEAT_INTERVAL = 60
+
+# Claims (by any worker) before a batch is given up on and marked failed
+MAX_ATTEMPTS = 3
+
+# How often an idle worker checks whether a lease has expired
+POLL_INTERVAL = 30
+
+# WAL needs shared memory, which network filesystems don't provide, so the
+# queue stays in rollback-journal mode; writes are tiny and rare anyway.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id       TEXT PRIMARY KEY,
+    position      INTEGER NOT NULL,
+    trackers      TEXT NOT NULL,
+    est_rows      INTEGER,
+    state         TEXT NOT NULL DEFAULT 'pending',
+    worker        TEXT,
+    lease_expires REAL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    partial_path  TEXT,
+    updated_at    REAL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_state ON tasks(state, position);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+###############################################################################
+# QUEUE
+###############################################################################
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    Batches of action_tracker_ids shared by several scrape.py workers.
+    States: pending -> leased -> done, or back to pending when a lease
+    expires or a query fails, and failed after MAX_ATTEMPTS claims.
+    Every state change runs in a BEGIN IMMEDIATE transaction, so two workers
+    can't claim the same batch.
+    """
+    def __init__(self, path=WORK_QUEUE_DB, worker_id=None):
+        self.path = os.path.abspath(path)
+        self.worker_id = worker_id or default_worker_id()
+        self.partials_dir = os.path.join(os.path.dirname(self.path), "partials")
+        # autocommit; transactions are opened explicitly in _transaction()
+        self.conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def is_seeded(self):
+        return self.conn.execute("SELECT 1 FROM tasks LIMIT 1").fetchone() is not None
+
+    def seed(self, tasks, **meta):
+        """
+        Fill an empty queue with [(task_id, tracker_ids, est_rows)], in the
+        order they should be claimed, and store 'meta' (settings every worker
+        must share; see get_meta()). If another worker seeded it first, its
+        plan is kept. Returns True if this call seeded the queue.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM tasks LIMIT 1").fetchone():
+                return False
+            conn.executemany(
+                "INSERT INTO tasks (task_id, position, trackers, est_rows, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(task_id, pos, json.dumps(trackers), est_rows, now)
+                 for pos, (task_id, trackers, est_rows) in enumerate(tasks)],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [("seeded_by", self.worker_id)] + [(k, str(v)) for k, v in meta.items()],
+            )
+        return True
+
+    def get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def claim(self):
+        """
+        Lease the next pending batch, or one whose lease has expired.
+        Returns {"task_id", "trackers", "est_rows", "attempts"} or None if
+        nothing is claimable right now.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            while True:
+                row = conn.execute(
+                    "SELECT task_id, trackers, est_rows, attempts FROM tasks "
+                    "WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) "
+                    "ORDER BY position LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    return None
+                task_id, trackers, est_rows, attempts = row
+                if attempts >= MAX_ATTEMPTS:
+                    # its last worker died (or it kept failing); don't hand it out again
+                    conn.execute(
+                        "UPDATE tasks SET state = 'failed', worker = NULL, updated_at = ? "
+                        "WHERE task_id = ?",
+                        (now, task_id),
+                    )
+                    continue
+                conn.execute(
+                    "UPDATE tasks SET state = 'leased', worker = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE task_id = ?",
+                    (self.worker_id, now + LEASE_SECONDS, now, task_id),
+                )
+                return {
+                    "task_id": task_id,
+                    "trackers": json.loads(trackers),
+                    "est_rows": est_rows,
+                    "attempts": attempts + 1,
+                }
+
+    def heartbeat(self, task_id):
+        """
+        Extend this worker's lease on task_id. Returns False if the lease was
+        lost (it expired and another worker claimed the batch).
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE tasks SET lease_expires = ?, updated_at = ? "
+                "WHERE task_id = ? AND state = 'leased' AND worker = ?",
+                (now + LEASE_SECONDS, now, task_id, self.worker_id),
+            ).rowcount == 1
+
+    def complete(self, task_id, partial_path):
+        """
+        Mark task_id done with its published partial result. Returns False
+        (and changes nothing) if this worker no longer holds the lease:
+        another worker has claimed the batch and will publish its own.
+        """
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE tasks SET state = 'done', lease_expires = NULL, "
+                "partial_path = ?, updated_at = ? "
+                "WHERE task_id = ? AND state = 'leased' AND worker = ?",
+                (partial_path, time.time(), task_id, self.worker_id),
+            ).rowcount == 1
+
+    def fail(self, task_id):
+        """
+        Give task_id back after a failed query: pending again (any worker may
+        retry it) or failed once it has been tried MAX_ATTEMPTS times.
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "worker = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE task_id = ? AND state = 'leased' AND worker = ?",
+                (MAX_ATTEMPTS, time.time(), task_id, self.worker_id),
+            )
+
+    def counts(self):
+        return dict(self.conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state"))
+
+    def finished(self):
+        """
+        True once every batch is done or failed.
+        """
+        row = self.conn.execute(
+            "SELECT COUNT(*) FROM tasks WHERE state IN ('pending', 'leased')"
+        ).fetchone()
+        return self.is_seeded() and row[0] == 0
+
+    def partials(self):
+        return [p for (p,) in self.conn.execute(
+            "SELECT partial_path FROM tasks WHERE state = 'done' ORDER BY position"
+        )]
+
+    def failed_trackers(self):
+        trackers = []
+        for (raw,) in self.conn.execute(
+            "SELECT trackers FROM tasks WHERE state = 'failed' ORDER BY position"
+        ):
+            trackers.extend(json.loads(raw))
+        return trackers
+
+    def claim_merge(self):
+        """
+        True for exactly one caller once the queue is finished, so the last
+        worker to finish merges and the others just exit.
+        """
+        with self._transaction() as conn:
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE state IN ('pending', 'leased')"
+            ).fetchone()[0]
+            if pending or conn.execute("SELECT 1 FROM meta WHERE key = 'merged_by'").fetchone():
+                return False
+            conn.execute("INSERT INTO meta (key, value) VALUES ('merged_by', ?)", (self.worker_id,))
+        return True
+
+    def requeue_failed(self):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM meta WHERE key = 'merged_by'")
+            return conn.execute(
+                "UPDATE tasks SET state = 'pending', attempts = 0, updated_at = ? "
+                "WHERE state = 'failed'",
+                (time.time(),),
+            ).rowcount
+
+
+class Heartbeat:
+    """
+    Renews a lease every HEARTBEAT_INTERVAL seconds from a background thread
+    (with its own connection) while the main thread drives the browser.
+    'lost' is set if another worker has taken the batch over.
+    """
+    def __init__(self, queue, task_id, interval=HEARTBEAT_INTERVAL):
+        self.queue_path = queue.path
+        self.worker_id = queue.worker_id
+        self.task_id = task_id
+        self.interval = interval
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        queue = WorkQueue(self.queue_path, self.worker_id)
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    renewed = queue.heartbeat(self.task_id)
+                except sqlite3.OperationalError as e:
+                    # share briefly unavailable; the lease has slack for this
+                    print(f"  Heartbeat for {self.task_id} failed: {e}")
+                    continue
+                if not renewed:
+                    self.lost = True
+                    print(f"  Lease on {self.task_id} was taken over by another worker.")
+                    break
+        finally:
+            queue.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+###############################################################################
+# MAIN SCRIPT
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the shared scrape.py work queue.")
+    parser.add_argument("command", choices=["status", "requeue"])
+    parser.add_argument("--queue", default=WORK_QUEUE_DB)
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.queue)
+    try:
+        if args.command == "requeue":
+            print(f"Requeued {queue.requeue_failed()} failed batches.")
+            return
+        print(f"{queue.path}: " + ", ".join(f"{n} {state}" for state, n in sorted(queue.counts().items())))
+        now = time.time()
+        for task_id, worker, expires, attempts in queue.conn.execute(
+            "SELECT task_id, worker, lease_expires, attempts FROM tasks "
+            "WHERE state = 'leased' ORDER BY position"
+        ):
+            left = expires - now
+            status = f"lease {left:.0f}s left" if left > 0 else "lease expired"
+            print(f"  {task_id}: {worker}, attempt {attempts}, {status}")
+        failed = queue.failed_trackers()
+        if failed:
+            print("  Failed trackers:", failed)
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()